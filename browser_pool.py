@@ -0,0 +1,313 @@
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+import psutil
+from playwright.sync_api import sync_playwright
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+
+# 同一时刻只允许一个线程启动浏览器，以便从启动前后的子进程差异中准确识别新浏览器的进程
+_launch_lock = threading.Lock()
+
+
+def _child_processes() -> list:
+    """本进程的所有子进程"""
+    try:
+        return psutil.Process(os.getpid()).children(recursive=True)
+    except psutil.Error:
+        return []
+
+
+def launch_browser(playwright, headless: bool, slow_mo: int) -> tuple:
+    """启动Chromium，返回 (browser, 浏览器根进程列表)；其他线程的浏览器（如Cookie刷新线程）不包含在内"""
+    with _launch_lock:
+        before = {process.pid for process in _child_processes()}
+        browser = playwright.chromium.launch(headless=headless, slow_mo=slow_mo)
+        launched = [process for process in _child_processes() if process.pid not in before]
+
+    launched_pids = {process.pid for process in launched}
+    roots = []
+    for process in launched:
+        try:
+            if process.ppid() not in launched_pids:
+                roots.append(process)
+        except psutil.Error:
+            continue
+    return browser, roots
+
+
+def process_tree(roots: list) -> list:
+    """根进程及其当前所有子进程（浏览器之后启动的渲染进程等都在根进程之下）"""
+    processes = []
+    for root in roots:
+        try:
+            if not root.is_running():
+                continue
+            processes.append(root)
+            processes.extend(root.children(recursive=True))
+        except psutil.Error:
+            continue
+    return processes
+
+
+def kill_processes(processes: list):
+    """强制结束进程"""
+    for process in processes:
+        try:
+            if process.is_running():
+                process.kill()
+        except psutil.Error:
+            continue
+
+
+def process_tree_rss_mb(roots: list) -> float:
+    """浏览器进程树占用的物理内存(MB)"""
+    total = 0
+    for process in process_tree(roots):
+        try:
+            total += process.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / 1024 / 1024
+
+
+class BrowserPool:
+    """常驻浏览器池：保持一个浏览器进程和每个账号的上下文常驻，避免每个任务都冷启动
+
+    Playwright 同步接口只能在创建它的线程中使用，所以浏览器池只服务于调用 start() 的线程。
+    """
+
+    def __init__(self, config: dict, login_manager):
+        """初始化浏览器池"""
+        self.config = config
+        self.login_manager = login_manager
+        self.logger = logging.getLogger(__name__)
+
+        # 内存看门狗配置
+        settings = config.get('browser_pool', {})
+        self.max_tasks_per_context = settings.get('max_tasks_per_context', 50)
+        self.max_rss_mb = settings.get('max_rss_mb', 2048)
+        self.check_interval = settings.get('check_interval_seconds', 60)
+        self.probe_timeout = settings.get('probe_timeout_ms', 5000)
+
+        self._playwright = None
+        self.browser = None
+        # 本浏览器池启动的浏览器根进程，内存统计和强制结束只针对这棵进程树
+        self._browser_roots = []
+        self._owner = None
+        # 账号名 -> (context, 加载Cookie时Cookie文件的修改时间)
+        self._contexts = {}
+        # 账号名 -> 该上下文已执行的任务数
+        self._task_counts = {}
+        self._last_check = 0
+        self.rss_mb = 0.0
+        self.recycled = 0
+        self.restarts = 0
+
+    def start(self):
+        """启动浏览器"""
+        self._playwright = sync_playwright().start()
+        self._launch()
+        self._owner = threading.get_ident()
+        self.logger.info("常驻浏览器已启动")
+
+    def _launch(self):
+        """启动浏览器并记录其进程树"""
+        self.browser, self._browser_roots = launch_browser(
+            self._playwright,
+            self.config['browser']['headless'],
+            self.config['browser']['slow_mo']
+        )
+
+    def is_owner(self) -> bool:
+        """当前线程是否可以使用浏览器池"""
+        return self.browser is not None and self._owner == threading.get_ident()
+
+    def _cookie_mtime(self, account_name: str) -> float:
+        """账号Cookie文件的修改时间"""
+        cookie_file = self.login_manager.cookies_dir / f"{account_name}_cookies.json"
+        return cookie_file.stat().st_mtime if cookie_file.exists() else 0
+
+    def context_for(self, account_name: str, cookies: list):
+        """获取账号的常驻上下文（每次调用算作一个任务）
+
+        账号重新扫码登录过（Cookie文件更新）或上下文已执行够 max_tasks_per_context 个任务时重建。
+        """
+        self.check_memory()
+
+        cached = self._contexts.get(account_name)
+        mtime = self._cookie_mtime(account_name)
+        if cached:
+            context, loaded_mtime = cached
+            if self._task_counts.get(account_name, 0) >= self.max_tasks_per_context:
+                self.logger.info(f"账号 {account_name} 的上下文已执行 {self._task_counts[account_name]} 个任务，回收重建")
+                self.close_context(account_name)
+                self.recycled += 1
+            # 从上下文写回的Cookie本来就来自该上下文，不需要重建
+            elif mtime <= loaded_mtime or mtime == self.login_manager.synced_mtime.get(account_name):
+                self._task_counts[account_name] += 1
+                return context
+            else:
+                self.close_context(account_name)
+
+        context = self.browser.new_context(user_agent=USER_AGENT)
+        context.add_cookies(cookies)
+        self._contexts[account_name] = (context, mtime)
+        self._task_counts[account_name] = 1
+        self.logger.info(f"已为账号 {account_name} 创建常驻上下文")
+        return context
+
+    def check_memory(self, force: bool = False):
+        """检查浏览器进程树内存，超过水位时回收所有上下文，仍然超过时重启浏览器"""
+        if not force and time.time() - self._last_check < self.check_interval:
+            return
+        self._last_check = time.time()
+
+        self.rss_mb = process_tree_rss_mb(self._browser_roots)
+        if self.rss_mb <= self.max_rss_mb:
+            return
+
+        self.logger.warning(f"浏览器内存 {self.rss_mb:.0f}MB 超过水位 {self.max_rss_mb}MB，回收所有上下文")
+        for account_name in list(self._contexts):
+            self.close_context(account_name)
+            self.recycled += 1
+
+        self.rss_mb = process_tree_rss_mb(self._browser_roots)
+        if self.rss_mb > self.max_rss_mb:
+            self.logger.warning(f"回收上下文后内存仍为 {self.rss_mb:.0f}MB，重启浏览器")
+            self.restart()
+
+    def is_healthy(self) -> bool:
+        """检查浏览器是否还能响应驱动（新开页面并在限定时间内执行脚本）
+
+        同步接口的 new_page 没有超时参数，整个检查放在截止时间下进行：
+        超时仍未完成时结束浏览器进程树，让卡住的调用抛出异常，判定为不健康。
+        """
+        if self.browser is None or not self.browser.is_connected():
+            return False
+
+        expired = threading.Event()
+
+        def on_deadline():
+            expired.set()
+            self.logger.warning(f"浏览器健康检查 {self.probe_timeout}ms 内未完成，结束浏览器进程")
+            kill_processes(process_tree(self._browser_roots))
+
+        deadline = threading.Timer(self.probe_timeout / 1000, on_deadline)
+        deadline.daemon = True
+        deadline.start()
+        page = None
+        try:
+            page = self.browser.new_page()
+            page.wait_for_function("() => true", timeout=self.probe_timeout)
+            return not expired.is_set()
+        except Exception as e:
+            self.logger.warning(f"浏览器健康检查失败: {e}")
+            return False
+        finally:
+            deadline.cancel()
+            if page is not None:
+                try:
+                    page.close()
+                except Exception as e:
+                    self.logger.debug(f"关闭健康检查页面失败: {e}")
+
+    def restart(self):
+        """重启浏览器：无法正常关闭时直接结束进程树"""
+        self.logger.warning("正在重启常驻浏览器")
+        self._contexts.clear()
+        self._task_counts.clear()
+
+        processes = process_tree(self._browser_roots)
+        try:
+            if self.browser and self.browser.is_connected():
+                self.browser.close()
+        except Exception as e:
+            self.logger.warning(f"关闭浏览器失败，强制结束进程: {e}")
+        finally:
+            # 只结束本浏览器池的浏览器进程树，不影响其他线程正在使用的浏览器
+            kill_processes(processes)
+
+        self._launch()
+        self.restarts += 1
+        self.logger.info("常驻浏览器已重启")
+
+    def stats(self) -> dict:
+        """看门狗统计信息"""
+        return {
+            'rss_mb': round(self.rss_mb, 1),
+            'contexts': dict(self._task_counts),
+            'recycled_contexts': self.recycled,
+            'browser_restarts': self.restarts,
+        }
+
+    def close_context(self, account_name: str):
+        """关闭账号的常驻上下文"""
+        self._task_counts.pop(account_name, None)
+        cached = self._contexts.pop(account_name, None)
+        if cached:
+            try:
+                cached[0].close()
+            except Exception as e:
+                self.logger.debug(f"关闭账号 {account_name} 的上下文失败: {e}")
+
+    def warm_accounts(self) -> list:
+        """当前保持常驻上下文的账号"""
+        return list(self._contexts)
+
+    def stop(self):
+        """关闭所有上下文和浏览器"""
+        for account_name in list(self._contexts):
+            self.close_context(account_name)
+        try:
+            if self.browser:
+                self.browser.close()
+            if self._playwright:
+                self._playwright.stop()
+        finally:
+            self.browser = None
+            self._browser_roots = []
+            self._playwright = None
+            self._owner = None
+        self.logger.info("常驻浏览器已关闭")
+
+
+@contextmanager
+def open_account_page(config: dict, account_name: str, cookies: list, pool: BrowserPool = None,
+                      headless: bool = None, slow_mo: int = None):
+    """打开一个已加载账号Cookie的页面，产出 (context, page)
+
+    当前线程持有常驻浏览器池时复用账号上下文，只新建/关闭页面；否则按原来的方式临时启动浏览器。
+    """
+    if pool is not None and pool.is_owner():
+        context = pool.context_for(account_name, cookies)
+        page = context.new_page()
+        page.set_default_timeout(config['browser']['timeout'])
+        try:
+            yield context, page
+        finally:
+            page.close()
+        return
+
+    with sync_playwright() as p:
+        browser, _ = launch_browser(
+            p,
+            config['browser']['headless'] if headless is None else headless,
+            config['browser']['slow_mo'] if slow_mo is None else slow_mo
+        )
+
+        context = browser.new_context(user_agent=USER_AGENT)
+
+        # 添加Cookie
+        context.add_cookies(cookies)
+
+        page = context.new_page()
+        page.set_default_timeout(config['browser']['timeout'])
+
+        try:
+            yield context, page
+        finally:
+            browser.close()
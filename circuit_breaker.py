@@ -0,0 +1,155 @@
+import logging
+import threading
+from urllib.parse import urlparse
+import clock
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+STATE_LABELS = {CLOSED: "正常", OPEN: "熔断", HALF_OPEN: "试探中"}
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后熔断，熔断期间直接拒绝，不再启动浏览器等待超时；
+    冷却时间过后只放行一次试探，试探成功则恢复，失败则重新熔断"""
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, key: str, settings: dict = None):
+        """获取账号（account:名称）或站点（site:域名）对应的共享熔断器，进程内发布和评论共用"""
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(key, settings)
+            return cls._shared[key]
+
+    @classmethod
+    def for_account(cls, account_name: str, settings: dict = None):
+        """账号熔断器"""
+        return cls.shared(f"account:{account_name}", settings)
+
+    @classmethod
+    def for_site(cls, url: str, settings: dict = None):
+        """站点熔断器，按域名区分（www 与 creator 分别熔断）"""
+        return cls.shared(f"site:{urlparse(url).hostname or url}", settings)
+
+    @classmethod
+    def snapshot_all(cls, tripped_only: bool = False) -> list:
+        """所有熔断器的状态，tripped_only 为只返回熔断过或拒绝过调用的"""
+        with cls._shared_lock:
+            breakers = list(cls._shared.values())
+        snapshots = [breaker.snapshot() for breaker in breakers]
+        if tripped_only:
+            snapshots = [s for s in snapshots if s['trips'] or s['rejected'] or s['state'] != CLOSED]
+        return sorted(snapshots, key=lambda s: s['name'])
+
+    def __init__(self, name: str, settings: dict = None):
+        """初始化熔断器"""
+        settings = settings or {}
+        self.name = name
+        self.failure_threshold = max(1, settings.get('failure_threshold', 3))
+        self.reset_timeout = settings.get('reset_timeout_seconds', 300)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否放行一次调用；冷却结束后只放行一次试探，直到试探有结果"""
+        with self._lock:
+            if self.state == OPEN and clock.now() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+                logger.info(f"{self.name} 冷却结束，放行一次试探")
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def is_open(self) -> bool:
+        """是否处于熔断冷却中"""
+        with self._lock:
+            return self.state == OPEN and clock.now() - self.opened_at < self.reset_timeout
+
+    def release(self):
+        """放行后调用未实际执行（例如被其他熔断器拒绝）时交还试探名额"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        """记录成功"""
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"{self.name} 试探成功，恢复正常")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """记录失败"""
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.trips += 1
+                    logger.warning(f"{self.name} 连续失败 {self.consecutive_failures} 次，熔断 {self.reset_timeout} 秒")
+                self.state = OPEN
+                self.opened_at = clock.now()
+            self._probing = False
+
+    def snapshot(self) -> dict:
+        """当前状态"""
+        with self._lock:
+            retry_in = self.opened_at + self.reset_timeout - clock.now() if self.state == OPEN else 0
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'retry_in': round(max(0, retry_in)),
+            }
+
+
+def acquire(breakers: list):
+    """依次检查多个熔断器，全部放行时返回None，否则返回拒绝的熔断器（已放行的试探名额会交还）"""
+    allowed = []
+    for breaker in breakers:
+        if not breaker.allow():
+            for granted in allowed:
+                granted.release()
+            return breaker
+        allowed.append(breaker)
+    return None
+
+
+def format_snapshot(snapshot: dict) -> str:
+    """熔断器状态的单行描述"""
+    text = (f"{snapshot['name']}: {STATE_LABELS[snapshot['state']]}，熔断 {snapshot['trips']} 次，"
+            f"快速失败 {snapshot['rejected']} 次")
+    if snapshot['state'] == OPEN:
+        text += f"，{snapshot['retry_in']} 秒后试探"
+    return text
+
+
+def record_outcome(account_breaker: CircuitBreaker, site_breaker: CircuitBreaker, success: bool, error: str = None):
+    """按一次发布/评论的结果更新账号和站点熔断器：登录失效只计入账号，站点正常响应；其他失败两者都计入"""
+    if success:
+        account_breaker.record_success()
+        site_breaker.record_success()
+    elif error == "LoginExpired":
+        account_breaker.record_failure()
+        site_breaker.record_success()
+    else:
+        account_breaker.record_failure()
+        site_breaker.record_failure()
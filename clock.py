@@ -0,0 +1,80 @@
+import time
+import threading
+
+
+class RealClock:
+    """真实时钟"""
+
+    simulated = False
+
+    def now(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def stats(self) -> dict:
+        return {}
+
+
+class SimulatedClock:
+    """虚拟时钟：sleep 立即返回并把时间向前推进
+
+    虚拟时间 = 开始时间 + 实际经过的时间 + 累计“睡眠”的时间，因此刻意的等待（随机延迟、打字间隔、发帖间隔）
+    不再占用真实时间，实际工作（页面操作、网络请求）照常计时，两者分别统计。
+    """
+
+    simulated = True
+
+    def __init__(self, start: float = None):
+        """初始化，start 为虚拟的开始时间（默认当前时间）"""
+        self.start = time.time() if start is None else start
+        self._real_start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.slept = 0.0
+        self.sleeps = 0
+
+    def now(self) -> float:
+        return self.start + (time.perf_counter() - self._real_start) + self.slept
+
+    def sleep(self, seconds: float):
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.slept += seconds
+            self.sleeps += 1
+
+    def stats(self) -> dict:
+        """虚拟经过时间中等待和实际工作各占多少（秒）"""
+        working = time.perf_counter() - self._real_start
+        return {
+            'virtual_elapsed': round(working + self.slept, 1),
+            'slept': round(self.slept, 1),
+            'working': round(working, 1),
+            'sleep_calls': self.sleeps,
+        }
+
+
+_clock = RealClock()
+
+
+def get_clock():
+    """当前使用的时钟"""
+    return _clock
+
+
+def use_clock(clock):
+    """切换所有模块使用的时钟（需在开始运行前调用）"""
+    global _clock
+    _clock = clock
+
+
+def now() -> float:
+    """当前时间戳（虚拟时钟下为虚拟时间）"""
+    return _clock.now()
+
+
+def sleep(seconds: float):
+    """刻意的等待：真实时钟下睡眠，虚拟时钟下立即返回并推进时间"""
+    _clock.sleep(seconds)
@@ -0,0 +1,86 @@
+import hashlib
+import logging
+from pathlib import Path
+from urllib.parse import urlparse
+import clock
+
+
+def extract_note_id(note_url: str) -> str:
+    """从笔记链接中提取笔记ID（如 /explore/<id>），无法识别时返回去掉查询参数的链接"""
+    note_url = note_url.strip()
+    parsed = urlparse(note_url)
+    if not parsed.netloc:
+        # 已经是笔记ID
+        return note_url
+
+    parts = [part for part in parsed.path.split('/') if part]
+    if parts:
+        return parts[-1]
+    return f"{parsed.netloc}{parsed.path}"
+
+
+class CommentHistory:
+    """已评论记录：持久化 (账号, 笔记ID, 评论哈希, 时间戳)，内存中保存 (账号, 笔记ID) 集合用于快速去重"""
+
+    def __init__(self, history_file: str):
+        """初始化评论历史，启动时一次性加载到内存"""
+        self.history_file = Path(history_file)
+        self.history_file.parent.mkdir(parents=True, exist_ok=True)
+        self.logger = logging.getLogger(__name__)
+
+        self._seen = set()
+        self._load()
+
+    def _load(self):
+        """加载历史文件（制表符分隔，每行一条，比逐行解析JSON快得多）"""
+        if not self.history_file.exists():
+            return
+
+        try:
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) >= 2:
+                        self._seen.add((fields[0], fields[1]))
+            self.logger.info(f"已加载 {len(self._seen)} 条评论历史")
+        except Exception as e:
+            self.logger.error(f"加载评论历史失败: {e}")
+
+    @staticmethod
+    def _clean(value: str) -> str:
+        """去掉会破坏行格式的字符"""
+        return value.replace('\t', ' ').replace('\n', ' ')
+
+    def has_commented(self, account_name: str, note_url: str) -> bool:
+        """判断账号是否已评论过该笔记"""
+        return (self._clean(account_name), extract_note_id(note_url)) in self._seen
+
+    def filter_pending(self, account_name: str, note_urls: list) -> list:
+        """过滤出账号尚未评论的笔记链接（同时去掉列表内重复的笔记）"""
+        account_key = self._clean(account_name)
+        pending = []
+        queued = set()
+
+        for note_url in note_urls:
+            note_id = extract_note_id(note_url)
+            if (account_key, note_id) in self._seen or note_id in queued:
+                continue
+            queued.add(note_id)
+            pending.append(note_url)
+
+        return pending
+
+    def record(self, account_name: str, note_url: str, comment_text: str):
+        """记录一次成功的评论"""
+        key = (self._clean(account_name), extract_note_id(note_url))
+        comment_hash = hashlib.sha1(comment_text.encode('utf-8')).hexdigest()[:16]
+
+        try:
+            with open(self.history_file, 'a', encoding='utf-8') as f:
+                f.write(f"{key[0]}\t{key[1]}\t{comment_hash}\t{int(clock.now())}\n")
+            self._seen.add(key)
+        except Exception as e:
+            self.logger.error(f"写入评论历史失败: {e}")
+
+    def __len__(self):
+        return len(self._seen)
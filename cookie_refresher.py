@@ -0,0 +1,95 @@
+import threading
+import logging
+import clock
+
+
+class CookieRefresher:
+    """后台Cookie刷新：在账号Cookie即将过期或长时间空闲时访问一次首页，让服务器续期会话"""
+
+    def __init__(self, login_manager, settings: dict = None):
+        """初始化刷新器"""
+        settings = settings or {}
+        self.login_manager = login_manager
+        self.check_interval = settings.get('check_interval_minutes', 30) * 60
+        self.refresh_before = settings.get('refresh_before_hours', 24) * 3600
+        self.max_idle = settings.get('max_idle_hours', 12) * 3600
+        self.auth_cookies = settings.get('auth_cookies', ['web_session'])
+        self.logger = logging.getLogger(__name__)
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def cookie_expiry(self, cookies: list) -> float:
+        """返回登录凭证Cookie的最早过期时间，没有带过期时间的Cookie时返回None"""
+        expiries = [c['expires'] for c in cookies if c.get('expires', -1) > 0 and c.get('name') in self.auth_cookies]
+        if not expiries:
+            # 未找到登录凭证Cookie时退回到所有持久Cookie
+            expiries = [c['expires'] for c in cookies if c.get('expires', -1) > 0]
+        return min(expiries) if expiries else None
+
+    def _last_active(self, account_name: str) -> float:
+        """账号最近一次成功操作的时间，本进程中没有记录时使用Cookie文件的修改时间"""
+        if account_name in self.login_manager.last_active:
+            return self.login_manager.last_active[account_name]
+        cookie_file = self.login_manager.cookies_dir / f"{account_name}_cookies.json"
+        return cookie_file.stat().st_mtime if cookie_file.exists() else 0
+
+    def due_accounts(self) -> list:
+        """需要刷新的账号列表（没有Cookie的账号需要重新扫码，不在此列）"""
+        now = clock.now()
+        due = []
+        for account in self.login_manager.config['accounts']:
+            account_name = account['name']
+            cookies = self.login_manager.load_cookies(account_name)
+            if not cookies:
+                continue
+
+            expiry = self.cookie_expiry(cookies)
+            if expiry is not None and expiry - now < self.refresh_before:
+                due.append(account_name)
+            elif now - self._last_active(account_name) > self.max_idle:
+                due.append(account_name)
+        return due
+
+    def refresh_due_accounts(self) -> dict:
+        """刷新所有到期账号，返回 {账号: 会话是否仍有效}"""
+        results = {}
+        for account_name in self.due_accounts():
+            if self._stop_event.is_set():
+                break
+            # 主线程正在用该账号发布/评论时跳过，不为同一账号再开一个浏览器（该操作本身也会续期会话）
+            with self.login_manager.account_session(account_name, wait=False) as acquired:
+                if not acquired:
+                    self.logger.info(f"账号 {account_name} 正在使用中，跳过本次刷新")
+                    continue
+                self.logger.info(f"刷新账号 {account_name} 的会话")
+                # 用浏览器访问首页才能让服务器续期会话，成功时自动写回更新后的Cookie
+                results[account_name] = self.login_manager.verify_login_status(account_name, use_probe=False)
+            if not results[account_name]:
+                self.logger.warning(f"账号 {account_name} 会话已失效，需要重新扫码登录")
+        return results
+
+    def _run(self):
+        """后台线程主循环"""
+        while not self._stop_event.is_set():
+            try:
+                self.refresh_due_accounts()
+            except Exception as e:
+                self.logger.error(f"刷新Cookie时出现错误: {e}")
+            self._stop_event.wait(self.check_interval)
+
+    def start(self):
+        """启动后台刷新线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="cookie-refresher", daemon=True)
+        self._thread.start()
+        self.logger.info("Cookie后台刷新已启动")
+
+    def stop(self):
+        """停止后台刷新线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
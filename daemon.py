@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import queue
+import socket
+import logging
+import threading
+import socketserver
+from pathlib import Path
+from browser_pool import BrowserPool
+
+
+class JobRequestHandler(socketserver.StreamRequestHandler):
+    """每行一个JSON请求，每个请求返回一行JSON结果"""
+
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line.decode('utf-8'))
+                response = self.server.job_daemon.handle(request)
+            except Exception as e:
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response, ensure_ascii=False) + "\n").encode('utf-8'))
+            self.wfile.flush()
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class JobDaemon:
+    """守护进程：常驻浏览器和账号上下文，通过本地 Unix 套接字（或 localhost TCP）接收发布、评论、验证任务
+
+    所有浏览器操作都在同一个工作线程中按顺序执行，连接线程只负责收发请求。
+    """
+
+    # 任务类型 -> 除 account 之外的必填参数
+    JOB_TYPES = {'publish': ('draft',), 'comment': ('note_url',), 'verify': ()}
+
+    def __init__(self, bot):
+        """初始化守护进程"""
+        self.bot = bot
+        self.config = bot.login_manager.config
+        self.settings = self.config.get('daemon', {})
+        self.logger = logging.getLogger(__name__)
+
+        self.jobs = queue.Queue()
+        self.pool = None
+        self.server = None
+        self.started_at = time.time()
+        self.completed = 0
+        # 单个任务的最长等待时间（含排队），超时后向客户端返回失败
+        self.job_timeout = self.settings.get('job_timeout_seconds', 900)
+        self._worker = None
+        # 工作线程退出的原因；退出后新任务直接返回失败
+        self.worker_error = None
+        self._jobs_lock = threading.Lock()
+
+    def _worker_loop(self):
+        """工作线程：持有常驻浏览器，依次执行任务"""
+        try:
+            self.pool = BrowserPool(self.config, self.bot.login_manager)
+            try:
+                self.pool.start()
+            except Exception:
+                self.pool.stop()
+                raise
+            for module in (self.bot.login_manager, self.bot.publisher, self.bot.gpt_reply):
+                module.browser_pool = self.pool
+
+            try:
+                while True:
+                    job = self.jobs.get()
+                    if job is None:
+                        break
+                    # 客户端已超时放弃的任务不再执行
+                    if job['cancelled']:
+                        continue
+                    try:
+                        job['response'] = self._execute(job['request'])
+                    except Exception as e:
+                        # 浏览器重启失败等：回复当前任务，继续处理后续任务
+                        self.logger.error(f"执行任务时出现错误: {e}", exc_info=True)
+                        job['response'] = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+                    self.completed += 1
+                    job['done'].set()
+            finally:
+                self.pool.stop()
+        except Exception as e:
+            self.logger.error(f"浏览器工作线程退出: {e}", exc_info=True)
+            self.worker_error = f"{type(e).__name__}: {e}"
+        finally:
+            self._fail_pending_jobs()
+
+    def _fail_pending_jobs(self):
+        """工作线程退出后，向仍在排队的任务返回失败"""
+        with self._jobs_lock:
+            if self.worker_error is None:
+                self.worker_error = "守护进程正在停止"
+            while True:
+                try:
+                    job = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    continue
+                job['response'] = {'ok': False, 'error': f"浏览器工作线程已退出: {self.worker_error}"}
+                job['done'].set()
+
+    def _execute(self, request: dict) -> dict:
+        """执行任务；失败且浏览器已无响应时重启浏览器，并在新浏览器上重试一次"""
+        for attempt in range(2):
+            try:
+                response = {'ok': True, 'result': self.bot.run_job(request)}
+                failed = response['result']['status'] == 'failed'
+            except Exception as e:
+                self.logger.error(f"执行任务失败: {e}")
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+                failed = True
+
+            if not failed or attempt or self.pool.is_healthy():
+                return response
+
+            self.logger.warning("浏览器无响应，重启后重试任务")
+            self.pool.restart()
+        return response
+
+    def handle(self, request: dict) -> dict:
+        """处理一个请求（在连接线程中调用）"""
+        job_type = request.get('type')
+
+        if job_type == 'status':
+            return {'ok': True, 'result': {
+                'pid': os.getpid(),
+                'uptime': round(time.time() - self.started_at, 1),
+                'queued': self.jobs.qsize(),
+                'worker_error': self.worker_error,
+                'completed': self.completed,
+                'warm_accounts': self.pool.warm_accounts() if self.pool else [],
+                'browser': self.pool.stats() if self.pool else {},
+            }}
+
+        if job_type == 'shutdown':
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return {'ok': True, 'result': 'shutting down'}
+
+        if job_type not in self.JOB_TYPES:
+            return {'ok': False, 'error': f"未知任务类型: {job_type}"}
+        for field in ('account',) + self.JOB_TYPES[job_type]:
+            if not isinstance(request.get(field), str) or not request[field].strip():
+                return {'ok': False, 'error': f"缺少 {field} 参数"}
+
+        job = {'request': request, 'done': threading.Event(), 'response': None, 'cancelled': False}
+        with self._jobs_lock:
+            if self.worker_error is not None:
+                return {'ok': False, 'error': f"浏览器工作线程已退出: {self.worker_error}"}
+            self.jobs.put(job)
+        if not job['done'].wait(self.job_timeout):
+            job['cancelled'] = True
+            return {'ok': False, 'error': f"任务在 {self.job_timeout} 秒内没有完成"}
+        return job['response']
+
+    def _create_server(self):
+        """创建监听服务：支持 Unix 套接字时优先使用，否则监听 localhost TCP 端口"""
+        socket_path = self.settings.get('socket', 'data/daemon.sock')
+        if hasattr(socket, 'AF_UNIX') and self.settings.get('transport', 'unix') == 'unix':
+            socket_path = Path(socket_path)
+            socket_path.parent.mkdir(parents=True, exist_ok=True)
+            if socket_path.exists():
+                socket_path.unlink()
+            server = ThreadingUnixServer(str(socket_path), JobRequestHandler)
+            address = f"unix:{socket_path}"
+        else:
+            port = self.settings.get('port', 8765)
+            server = ThreadingTCPServer(('127.0.0.1', port), JobRequestHandler)
+            address = f"127.0.0.1:{port}"
+
+        server.job_daemon = self
+        return server, address
+
+    def serve_forever(self):
+        """启动工作线程并开始接收任务，直到收到 shutdown 请求或被中断"""
+        self._worker = threading.Thread(target=self._worker_loop, name="browser-worker", daemon=True)
+        self._worker.start()
+
+        self.server, address = self._create_server()
+        self.logger.info(f"守护进程已启动，监听 {address}")
+        print(f"🚀 守护进程已启动，监听 {address}")
+        print("   使用 python xhs_client.py status 查看状态")
+
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if isinstance(self.server, ThreadingUnixServer):
+                Path(self.server.server_address).unlink(missing_ok=True)
+            self.jobs.put(None)
+            self._worker.join(timeout=30)
+            self.logger.info("守护进程已停止")
@@ -1,24 +1,49 @@
 import json
-import os
-import time
 import random
 from pathlib import Path
-from playwright.sync_api import sync_playwright, Page
+from playwright.sync_api import Page, Locator
 import yaml
 import logging
-from datetime import datetime, timedelta
-import openai
+import clock
 from login_manager import LoginManager
+from browser_pool import open_account_page
+from comment_history import CommentHistory, extract_note_id
+from note_cache import NoteContentCache
+from note_extractor import extract_from_page
+from run_report import make_result
+from target_source import FileTargetSource, open_target_source
+from template_ranker import TemplateRanker
+from step_runner import StepRunner, StepFailed
+from profiler import trace_operation
+from llm_router import LLMRouter
+import circuit_breaker
+from circuit_breaker import CircuitBreaker
 
 class GPTReply:
-    def __init__(self, config_path: str = "config.yaml"):
+    def __init__(self, config_path: str = "config.yaml", login_manager: LoginManager = None):
         """初始化GPT回复管理器"""
         self.config = self._load_config(config_path)
         self.setup_logging()
-        self.login_manager = LoginManager(config_path)
+        self.login_manager = login_manager or LoginManager(config_path)
+        self.selectors = self.login_manager.selectors
+        self.timeouts = self.login_manager.timeouts
+        # 常驻浏览器池（守护进程模式下设置）
+        self.browser_pool = None
         
-        # 初始化OpenAI客户端
-        openai.api_key = self.config['openai']['api_key']
+        # 初始化LLM路由（一个或多个OpenAI兼容后端）
+        self.llm_router = LLMRouter.from_config(self.config)
+        
+        # 加载已评论记录，避免重复访问同一笔记
+        data_dir = Path(self.config['paths'].get('data', 'data/'))
+        self.comment_history = CommentHistory(data_dir / "comment_history.tsv")
+        
+        # 笔记内容缓存，多个账号评论同一笔记时只获取一次
+        cache_ttl = self.config['commenting'].get('note_cache_ttl_minutes', 60) * 60
+        miss_ttl = self.config['commenting'].get('note_cache_miss_ttl_minutes', 5) * 60
+        self.note_cache = NoteContentCache(data_dir / "note_cache.json", cache_ttl, miss_ttl)
+        
+        # 离线评论模板排序（可作为主后端，也是LLM失败时的备用方案）
+        self.template_ranker = TemplateRanker.from_config(self.config, data_dir / "template_index.npz")
         
     def _load_config(self, config_path: str) -> dict:
         """加载配置文件"""
@@ -43,19 +68,24 @@ class GPTReply:
     def random_delay(self, min_delay: int = 1000, max_delay: int = 3000):
         """随机延迟，模拟人工操作"""
         delay = random.randint(min_delay, max_delay)
-        time.sleep(delay / 1000)
+        clock.sleep(delay / 1000)
     
-    def human_like_typing(self, page: Page, selector: str, text: str):
-        """模拟人工输入文字"""
-        page.click(selector)
-        page.fill(selector, "")  # 清空输入框
+    def human_like_typing(self, element: Locator, text: str):
+        """模拟人工输入文字（element 为已定位到的输入框）"""
+        element.click()
+        element.fill("")  # 清空输入框
         
         for char in text:
-            page.type(selector, char)
-            time.sleep(random.randint(50, 150) / 1000)  # 随机输入间隔
+            element.type(char)
+            clock.sleep(random.randint(50, 150) / 1000)  # 随机输入间隔
     
     def generate_comment_with_gpt(self, note_content: str, comment_context: str = "") -> str:
         """使用GPT生成评论内容"""
+        if self.config['commenting'].get('backend', 'llm') == 'template':
+            comment = self.template_ranker.select(note_content)
+            self.logger.info(f"模板生成评论: {comment}")
+            return comment
+        
         try:
             prompt = f"""请为以下小红书笔记生成一条自然、友好的评论回复。评论应该：
 1. 表达对内容的认可和感谢
@@ -69,141 +99,188 @@ class GPTReply:
 
 请直接返回评论内容，不要包含其他说明："""
 
-            response = openai.ChatCompletion.create(
-                model=self.config['openai']['model'],
-                messages=[
+            comment = self.llm_router.chat(
+                [
                     {"role": "system", "content": "你是一个小红书用户，擅长写友好、自然的评论。"},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=self.config['openai']['max_tokens'],
                 temperature=self.config['openai']['temperature']
             )
-            
-            comment = response.choices[0].message.content.strip()
             self.logger.info(f"GPT生成评论: {comment}")
             return comment
             
         except Exception as e:
             self.logger.error(f"GPT生成评论失败: {e}")
-            # 使用备用模板
-            templates = self.config['commenting']['comment_templates']
-            return random.choice(templates)
+            # 使用与笔记内容最相似的备用模板
+            return self.template_ranker.select(note_content)
     
     def reply_to_note(self, account_name: str, note_url: str) -> bool:
         """对指定笔记进行评论回复"""
         self.logger.info(f"开始评论笔记: {note_url} (账号: {account_name})")
+        self.last_error = None
+        
+        # 账号或笔记所在站点已熔断时直接失败，不再生成评论、启动浏览器
+        account_breaker, site_breaker = self._circuit_breakers(account_name, note_url)
+        blocked = circuit_breaker.acquire([account_breaker, site_breaker])
+        if blocked:
+            self.logger.warning(f"{blocked.name} 已熔断，跳过评论: {note_url}")
+            self.last_error = f"CircuitOpen:{blocked.name}"
+            return False
         
         # 加载账号Cookie
         cookies = self.login_manager.load_cookies(account_name)
         if not cookies:
-            self.logger.error(f"账号 {account_name} 的Cookie不存在，请先登录")
+            self.logger.error(f"账号 {account_name} 的Cookie不存在，请先登录，无法评论: {note_url}")
+            account_breaker.record_failure()
+            site_breaker.release()
             return False
         
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=self.config['browser']['headless'],
-                slow_mo=self.config['browser']['slow_mo']
-            )
+        success = False
+        try:
+            # 优先使用缓存的笔记内容，命中时在打开浏览器前生成评论
+            note_content = self.note_cache.get_or_fetch(note_url)
+            comment_text = self.generate_comment_with_gpt(note_content) if note_content else ""
             
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-            )
+            # 有常驻浏览器池时复用账号上下文，否则临时启动浏览器
+            with self.login_manager.account_session(account_name), \
+                    open_account_page(self.config, account_name, cookies, self.browser_pool) as (context, page), \
+                    trace_operation(context, f"comment_{account_name}_{extract_note_id(note_url)}") as trace:
+                trace.success = self._run_comment_steps(account_name, note_url, note_content, comment_text, context, page)
+                success = trace.success
+                return success
+        finally:
+            circuit_breaker.record_outcome(account_breaker, site_breaker, success, self.last_error)
+    
+    def _circuit_breakers(self, account_name: str, note_url: str) -> tuple:
+        """账号和笔记所在站点的熔断器"""
+        settings = self.config.get('circuit_breaker', {})
+        return CircuitBreaker.for_account(account_name, settings), CircuitBreaker.for_site(note_url, settings)
+    
+    def _circuit_open(self, account_name: str, note_url: str) -> bool:
+        """账号或站点是否处于熔断冷却中（下一次评论会直接失败）"""
+        return any(breaker.is_open() for breaker in self._circuit_breakers(account_name, note_url))
+    
+    def _run_comment_steps(self, account_name: str, note_url: str, note_content: str, comment_text: str,
+                           context, page: Page) -> bool:
+        """依次执行评论步骤"""
+        steps = StepRunner(f"评论 {extract_note_id(note_url)}", self.config.get('step_retries', {}))
+        try:
+            # 访问笔记页面
+            if not steps.run('navigate', self._open_note_page, page, note_url):
+                self.logger.error(f"账号 {account_name} 登录状态已失效，无法评论: {note_url}")
+                self.last_error = "LoginExpired"
+                return False
+            
+            # 缓存未命中时，文档一到达就解析内嵌的笔记数据，在页面其余资源加载期间生成评论
+            if not note_content:
+                note_content, source = extract_from_page(page, self.selectors, extract_note_id(note_url))
+                if note_content:
+                    self.logger.info(f"笔记内容来源: {source}")
+                    self.note_cache.put(note_url, note_content, source)
+                    comment_text = self.generate_comment_with_gpt(note_content)
+                else:
+                    self.logger.warning("无法获取笔记内容，将使用默认模板")
+            
+            self.random_delay(3000, 5000)
+            
+            # 等待页面加载
+            page.wait_for_load_state("networkidle")
+            
+            # 滚动到评论区并打开评论输入框
+            steps.run('open_comment', self._open_comment_input, page)
+            
+            # 生成评论内容（笔记内容已提前获取时已生成）
+            if not comment_text:
+                comment_text = self.generate_comment_with_gpt(note_content)
             
-            # 添加Cookie
-            context.add_cookies(cookies)
+            # 输入评论
+            steps.run('fill', self._fill_comment, page, comment_text)
             
-            page = context.new_page()
-            page.set_default_timeout(self.config['browser']['timeout'])
+            # 点击发送按钮
+            steps.run('submit', self._click_send, page)
             
+            # 记录评论历史
+            self.comment_history.record(account_name, note_url, comment_text)
+            
+            # 写回服务器更新过的Cookie
+            self.login_manager.sync_cookies(account_name, context)
+            
+            # 检查评论是否发送成功
             try:
-                # 访问笔记页面
-                page.goto(note_url)
-                self.random_delay(3000, 5000)
-                
-                # 等待页面加载
-                page.wait_for_load_state("networkidle")
-                
-                # 检查是否已登录
-                try:
-                    if "login" in page.url.lower():
-                        self.logger.error(f"账号 {account_name} 登录状态已失效")
-                        return False
-                except:
-                    pass
-                
-                # 获取笔记内容用于生成评论
-                note_content = ""
-                try:
-                    content_element = page.locator('.content, .note-content, [data-testid="note-content"]').first
-                    if content_element.is_visible():
-                        note_content = content_element.text_content()
-                except:
-                    self.logger.warning("无法获取笔记内容，将使用默认模板")
-                
-                # 滚动到评论区
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                self.random_delay(2000, 4000)
-                
-                # 查找评论输入框
-                comment_input = page.locator('textarea[placeholder*="评论"], input[placeholder*="评论"], .comment-input').first
-                if not comment_input.is_visible():
-                    # 尝试点击评论按钮
-                    comment_btn = page.locator('button:has-text("评论"), .comment-btn').first
-                    if comment_btn.is_visible():
-                        comment_btn.click()
-                        self.random_delay(1000, 2000)
-                        comment_input = page.locator('textarea[placeholder*="评论"], input[placeholder*="评论"], .comment-input').first
-                
-                if comment_input.is_visible():
-                    # 生成评论内容
-                    comment_text = self.generate_comment_with_gpt(note_content)
-                    
-                    # 输入评论
-                    self.human_like_typing(page, comment_input, comment_text)
-                    self.random_delay(1000, 2000)
-                    
-                    # 点击发送按钮
-                    send_btn = page.locator('button:has-text("发送"), button:has-text("评论"), .send-btn').first
-                    if send_btn.is_visible():
-                        send_btn.click()
-                        self.random_delay(2000, 4000)
-                        
-                        # 检查评论是否发送成功
-                        try:
-                            # 查找刚发送的评论
-                            new_comment = page.locator(f'text="{comment_text}"').first
-                            if new_comment.is_visible():
-                                self.logger.info(f"评论发送成功: {comment_text}")
-                                return True
-                            else:
-                                self.logger.warning("评论可能已发送，但未找到确认元素")
-                                return True
-                        except:
-                            self.logger.warning("评论发送状态检查超时，可能已成功")
-                            return True
-                    else:
-                        self.logger.error("未找到发送按钮")
-                        return False
+                if steps.run('confirm', self._comment_visible, page, comment_text):
+                    self.logger.info(f"评论发送成功: {note_url} {comment_text}")
                 else:
-                    self.logger.error("未找到评论输入框")
-                    return False
-                    
-            except Exception as e:
-                self.logger.error(f"评论笔记时出现错误: {e}")
-                return False
-            finally:
-                browser.close()
+                    self.logger.warning(f"评论可能已发送，但未找到确认元素: {note_url}")
+            except StepFailed:
+                self.logger.warning(f"评论发送状态检查超时，可能已成功: {note_url}")
+            return True
+                
+        except StepFailed as e:
+            self.logger.error(f"评论笔记 {note_url} 时出现错误: {e}（已完成步骤: {steps.describe()}）")
+            self.last_error = f"{e.step}:{type(e.cause).__name__}"
+            return False
+        except Exception as e:
+            self.logger.error(f"评论笔记 {note_url} 时出现错误: {e}")
+            self.last_error = type(e).__name__
+            return False
+    
+    def _open_note_page(self, page: Page, note_url: str) -> bool:
+        """打开笔记页面（文档到达即返回），账号登录状态失效时返回False"""
+        with self.timeouts.step('note_page_load', self.config['browser']['timeout']) as timeout:
+            page.goto(note_url, timeout=timeout, wait_until="domcontentloaded")
+        return "login" not in page.url.lower()
+    
+    def _open_comment_input(self, page: Page):
+        """滚动到评论区，评论输入框不可见时点击评论按钮"""
+        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        self.random_delay(2000, 4000)
+        
+        if not self.selectors.is_visible(page, 'comment_input'):
+            comment_btn = self.selectors.find(page, 'comment_button')
+            if comment_btn is not None:
+                comment_btn.click()
+                self.random_delay(1000, 2000)
+        if self.selectors.find(page, 'comment_input') is None:
+            raise TimeoutError("未找到评论输入框")
+    
+    def _fill_comment(self, page: Page, comment_text: str):
+        """输入评论（重试时重新定位输入框并清空后再输入）"""
+        comment_input = self.selectors.find(page, 'comment_input')
+        if comment_input is None:
+            self._open_comment_input(page)
+            comment_input = self.selectors.find(page, 'comment_input')
+        self.human_like_typing(comment_input, comment_text)
+        self.random_delay(1000, 2000)
+    
+    def _click_send(self, page: Page):
+        """点击发送按钮（找不到按钮时还没有发送，可以安全重试）"""
+        send_btn = self.selectors.find(page, 'send_button')
+        if send_btn is None:
+            raise TimeoutError("未找到发送按钮")
+        send_btn.click()
+        self.random_delay(2000, 4000)
+    
+    def _comment_visible(self, page: Page, comment_text: str) -> bool:
+        """查找刚发送的评论"""
+        return page.locator(f'text="{comment_text}"').first.is_visible()
     
     def reply_to_multiple_notes(self, note_urls: list, max_comments: int = None) -> dict:
         """对多个笔记进行评论回复"""
+        results = {}
+        for record in self.iter_reply_to_notes(note_urls, max_comments):
+            results[f"{record['account']}_{record['target']}"] = record['status'] == 'success'
+        return results
+    
+    def iter_reply_to_notes(self, note_urls: list, max_comments: int = None):
+        """逐条产出评论结果记录，每篇笔记处理完立即返回，不在内存中累积"""
         if max_comments is None:
             max_comments = self.config['commenting']['max_comments_per_day']
         
         if not note_urls:
             self.logger.warning("没有提供笔记链接")
-            return {}
+            return
         
-        results = {}
         comments_count = 0
         
         for account in self.config['accounts']:
@@ -212,50 +289,130 @@ class GPTReply:
                 
             account_name = account['name']
             
+            # 过滤已评论过的笔记（在启动浏览器之前）
+            pending_urls = self.comment_history.filter_pending(account_name, note_urls)
+            skipped = len(note_urls) - len(pending_urls)
+            if skipped:
+                self.logger.info(f"账号 {account_name} 已评论过 {skipped} 篇笔记，跳过")
+            if not pending_urls:
+                continue
+            
             # 验证登录状态
             if not self.login_manager.verify_login_status(account_name):
                 self.logger.warning(f"账号 {account_name} 登录状态无效，跳过")
                 continue
             
             # 为每个账号评论笔记
-            for note_url in note_urls:
+            for note_url in pending_urls:
                 if comments_count >= max_comments:
                     break
                 
+                started_at = clock.now()
                 success = self.reply_to_note(account_name, note_url)
-                results[f"{account_name}_{note_url}"] = success
+                yield make_result('comment', account_name, note_url, success, started_at, self.last_error)
                 
                 if success:
                     comments_count += 1
                 
-                # 评论间隔
-                if len(note_urls) > 1:
+                # 评论间隔（熔断快速失败时没有访问页面，不需要等待）
+                if len(pending_urls) > 1 and not (self.last_error or '').startswith("CircuitOpen"):
                     interval_minutes = self.config['commenting']['min_interval_minutes']
                     if interval_minutes:
                         self.logger.info(f"等待 {interval_minutes} 分钟后继续评论...")
-                        time.sleep(interval_minutes * 60)
+                        clock.sleep(interval_minutes * 60)
+    
+    def iter_reply_to_source(self, source, max_comments: int = None):
+        """从目标笔记来源逐篇读取并评论，逐条产出结果记录
+
+        每篇笔记由所有账号处理完后保存来源的读取进度，中断后重新运行会从断点继续。
+        """
+        if max_comments is None:
+            max_comments = self.config['commenting']['max_comments_per_day']
         
-        return results
+        interval_minutes = self.config['commenting']['min_interval_minutes']
+        account_names = [account['name'] for account in self.config['accounts']]
+        login_valid = {}
+        comments_count = 0
+        
+        for note_url in source:
+            for account_name in account_names:
+                if comments_count >= max_comments:
+                    return
+                
+                if self.comment_history.has_commented(account_name, note_url):
+                    continue
+                
+                # 每个账号只在第一次用到时验证登录状态
+                if account_name not in login_valid:
+                    login_valid[account_name] = self.login_manager.verify_login_status(account_name)
+                    if not login_valid[account_name]:
+                        self.logger.warning(f"账号 {account_name} 登录状态无效，跳过")
+                if not login_valid[account_name]:
+                    continue
+                
+                # 评论间隔（账号或站点熔断中时会直接失败，不需要等待）
+                if comments_count and interval_minutes and not self._circuit_open(account_name, note_url):
+                    self.logger.info(f"等待 {interval_minutes} 分钟后继续评论...")
+                    clock.sleep(interval_minutes * 60)
+                
+                started_at = clock.now()
+                success = self.reply_to_note(account_name, note_url)
+                yield make_result('comment', account_name, note_url, success, started_at, self.last_error)
+                
+                if success:
+                    comments_count += 1
+            
+            source.commit()
+    
+    def target_source_file(self):
+        """配置的目标笔记文件（存在时优先于 target_notes 列表）"""
+        target_file = self.config['commenting'].get('target_source')
+        if target_file and Path(target_file).exists():
+            return Path(target_file)
+        return None
     
     def reply_to_target_notes(self) -> dict:
         """对配置中的目标笔记进行评论"""
+        results = {}
+        for record in self.iter_reply_to_target_notes():
+            results[f"{record['account']}_{record['target']}"] = record['status'] == 'success'
+        return results
+    
+    def iter_reply_to_target_notes(self):
+        """对配置中的目标笔记进行评论，逐条产出结果记录"""
+        target_file = self.target_source_file()
+        if target_file:
+            return self.iter_reply_to_source(FileTargetSource(target_file))
+        
         target_notes = self.config['commenting']['target_notes']
-        return self.reply_to_multiple_notes(target_notes)
+        return self.iter_reply_to_notes(target_notes)
+    
+    def iter_reply_to_file(self, target_file: str, max_comments: int = None):
+        """对 JSONL/CSV 文件中的目标笔记进行评论，逐条产出结果记录"""
+        return self.iter_reply_to_source(open_target_source(target_file), max_comments)
     
     def create_sample_target_notes(self):
-        """创建示例目标笔记配置"""
+        """创建示例目标笔记文件（不改写 config.yaml）"""
         sample_notes = [
             "https://www.xiaohongshu.com/explore/示例笔记ID1",
             "https://www.xiaohongshu.com/explore/示例笔记ID2"
         ]
         
-        # 更新配置文件
-        self.config['commenting']['target_notes'] = sample_notes
+        target_file = Path(self.config['commenting'].get('target_source') or "data/target_notes.jsonl")
+        if target_file.exists():
+            self.logger.info(f"目标笔记文件已存在: {target_file}")
+            return
         
-        with open("config.yaml", 'w', encoding='utf-8') as f:
-            yaml.dump(self.config, f, default_flow_style=False, allow_unicode=True)
+        target_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(target_file, 'w', encoding='utf-8') as f:
+            for note_url in sample_notes:
+                f.write(json.dumps({"url": note_url}, ensure_ascii=False) + "\n")
         
-        self.logger.info("已更新配置文件，添加了示例目标笔记")
+        self.logger.info(f"已创建示例目标笔记文件: {target_file}")
+    
+    def close(self):
+        """保存尚未写入文件的笔记内容缓存（退出前调用）"""
+        self.note_cache.flush()
 
 if __name__ == "__main__":
     # 测试评论功能
@@ -266,6 +423,7 @@ if __name__ == "__main__":
     
     # 对目标笔记进行评论
     results = gpt_reply.reply_to_target_notes()
+    gpt_reply.close()
     
     print("评论结果:")
     for key, success in results.items():
@@ -0,0 +1,199 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import openai
+from rate_limiter import RateLimiter, estimate_tokens
+
+# 延迟/错误率 EWMA 的平滑系数
+EWMA_ALPHA = 0.3
+# 服务端返回429时同一后端的最多尝试次数
+MAX_RATE_LIMIT_ATTEMPTS = 3
+
+
+class LLMBackend:
+    """单个 OpenAI 兼容后端及其延迟、错误统计"""
+
+    def __init__(self, name: str, model: str, api_key: str, base_url: str = None, timeout: float = 30,
+                 rate_limit: dict = None):
+        self.name = name
+        self.model = model
+        self.client = openai.OpenAI(api_key=api_key or "not-needed", base_url=base_url or None,
+                                    timeout=timeout, max_retries=0)
+        self.limiter = RateLimiter.shared(f"{base_url or 'openai'}|{model}", rate_limit)
+        self.latency_ewma = None
+        self.error_ewma = 0.0
+        self.latencies = deque(maxlen=50)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float):
+        """记录一次成功调用的延迟(秒)"""
+        with self._lock:
+            self.latencies.append(latency)
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency_ewma
+            self.error_ewma *= (1 - EWMA_ALPHA)
+            self.consecutive_failures = 0
+
+    def record_failure(self, cooldown: float, max_failures: int, max_error_rate: float):
+        """记录一次失败，连续失败或错误率达到阈值时暂停使用，暂停结束后重新试用"""
+        with self._lock:
+            self.error_ewma = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_ewma
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= max_failures or self.error_ewma > max_error_rate:
+                self.cooldown_until = time.time() + cooldown
+
+    def is_healthy(self) -> bool:
+        """是否可以接收请求"""
+        return time.time() >= self.cooldown_until
+
+    def p95(self):
+        """近期延迟的 p95(秒)，样本不足时返回 None"""
+        with self._lock:
+            if len(self.latencies) < 5:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+    def stats(self) -> dict:
+        """统计信息"""
+        return {
+            'model': self.model,
+            'latency_ewma': round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            'error_rate': round(self.error_ewma, 3),
+            'cooling_down': time.time() < self.cooldown_until,
+            **self.limiter.stats(),
+        }
+
+
+class LLMRouter:
+    """多后端 LLM 路由：按延迟 EWMA 选择最快的健康后端，可在 p95 截止时间后向次快后端发送对冲请求，取先返回的结果"""
+
+    def __init__(self, backends: list, settings: dict = None):
+        """初始化路由器"""
+        settings = settings or {}
+        self.backends = backends
+        self.hedge = settings.get('hedge', True)
+        self.hedge_default_ms = settings.get('hedge_default_ms', 3000)
+        self.max_error_rate = settings.get('max_error_rate', 0.5)
+        self.max_failures = settings.get('max_consecutive_failures', 3)
+        self.cooldown = settings.get('cooldown_seconds', 60)
+        self.logger = logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max(len(backends) * 2, 4), thread_name_prefix="llm")
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """从配置创建：llm.backends 为空时使用 openai 配置作为唯一后端"""
+        llm_config = config.get('llm', {})
+        openai_config = config['openai']
+        rate_limit = llm_config.get('rate_limit', {})
+        backends = []
+        for item in llm_config.get('backends') or []:
+            backends.append(LLMBackend(
+                item.get('name', item['model']),
+                item['model'],
+                item.get('api_key', openai_config['api_key']),
+                item.get('base_url'),
+                item.get('timeout', 30),
+                {**rate_limit, **item.get('rate_limit', {})}
+            ))
+        if not backends:
+            backends.append(LLMBackend('openai', openai_config['model'], openai_config['api_key'],
+                                       openai_config.get('base_url'), rate_limit=rate_limit))
+        return cls(backends, llm_config)
+
+    def _ranked(self) -> list:
+        """健康后端按延迟排序（还没有样本的后端排在最前，以便尽快获得统计）；全部暂停时按错误率排序兜底"""
+        healthy = [b for b in self.backends if b.is_healthy()]
+        if not healthy:
+            return sorted(self.backends, key=lambda b: b.error_ewma)
+        return sorted(healthy, key=lambda b: -1 if b.latency_ewma is None else b.latency_ewma)
+
+    def _create(self, backend: LLMBackend, messages: list, max_tokens: int, temperature: float):
+        """在限流器额度内调用后端；服务端返回429时按 Retry-After 暂停该后端的放行并排队重试"""
+        estimated = estimate_tokens(messages, max_tokens)
+        for attempt in range(MAX_RATE_LIMIT_ATTEMPTS):
+            with backend.limiter.acquire(estimated):
+                try:
+                    response = backend.client.chat.completions.create(
+                        model=backend.model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature
+                    )
+                except openai.RateLimitError as e:
+                    if attempt == MAX_RATE_LIMIT_ATTEMPTS - 1:
+                        raise
+                    retry_after = e.response.headers.get('retry-after')
+                    retry_after = float(retry_after) if retry_after else 2 ** attempt
+                    self.logger.info(f"LLM后端 {backend.name} 限流，{retry_after:.0f}秒后重试")
+                    backend.limiter.throttle(retry_after)
+                    continue
+            usage = getattr(response, 'usage', None)
+            backend.limiter.settle(estimated, usage.total_tokens if usage else 0)
+            return response
+
+    def _call(self, backend: LLMBackend, messages: list, max_tokens: int, temperature: float) -> str:
+        """调用单个后端并记录统计（延迟包含排队等待额度的时间）"""
+        start = time.time()
+        try:
+            response = self._create(backend, messages, max_tokens, temperature)
+            content = response.choices[0].message.content.strip()
+        except Exception as e:
+            backend.record_failure(self.cooldown, self.max_failures, self.max_error_rate)
+            self.logger.warning(f"LLM后端 {backend.name} 调用失败: {e}")
+            raise
+        backend.record_success(time.time() - start)
+        return content
+
+    def chat(self, messages: list, max_tokens: int = 150, temperature: float = 0.7) -> str:
+        """发送对话请求，返回生成的文本；所有后端都失败时抛出最后一个异常"""
+        ranked = self._ranked()
+        pending = {}
+        last_error = None
+
+        def submit(backend):
+            future = self._executor.submit(self._call, backend, messages, max_tokens, temperature)
+            pending[future] = backend
+
+        submit(ranked[0])
+        remaining = ranked[1:]
+
+        while pending:
+            # 只有一个请求在途且还有备选后端时，等到 p95 截止时间再考虑对冲
+            deadline = None
+            if self.hedge and remaining and len(pending) == 1:
+                p95 = next(iter(pending.values())).p95()
+                deadline = p95 if p95 is not None else self.hedge_default_ms / 1000
+
+            done, _ = wait(pending, timeout=deadline, return_when=FIRST_COMPLETED)
+            if not done:
+                backend = remaining.pop(0)
+                self.logger.info(f"LLM请求超过p95截止时间，向 {backend.name} 发送对冲请求")
+                submit(backend)
+                continue
+
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    content = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                self.logger.debug(f"LLM请求由 {backend.name} 完成")
+                return content
+
+            # 失败后立即切换到下一个后端
+            if not pending and remaining:
+                submit(remaining.pop(0))
+
+        raise last_error
+
+    def stats(self) -> dict:
+        """各后端统计"""
+        return {backend.name: backend.stats() for backend in self.backends}
@@ -0,0 +1,267 @@
+import os
+import re
+import json
+import time
+import logging
+from pathlib import Path
+from datetime import datetime
+import numpy as np
+
+# 日志行格式: asctime - name - levelname - message（旧日志没有 name）
+LINE_PATTERN = re.compile(
+    r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) - (?:(\S+) - )?(DEBUG|INFO|WARNING|ERROR|CRITICAL) - (.*)$'
+)
+
+# 各操作的开始、成功、失败日志。发布/评论按 (操作, 目标) 跟踪，结束日志中的目标与开始日志相同时才结束该操作，
+# 预取线程为下一篇文案输出的校验日志不会结束当前文案的发布；登录按账号跟踪
+OPERATIONS = {
+    'login': {
+        'logger': 'login_manager',
+        'sequential': False,
+        'start': [re.compile(r'开始扫码登录账号: (?P<target>.+)$'),
+                  re.compile(r'请使用小红书APP扫描二维码登录账号: (?P<target>.+)$')],
+        'success': [re.compile(r'^账号 (?P<target>.+) 扫码登录成功')],
+        'failure': [re.compile(r'^账号 (?P<target>.+) (?:扫码登录超时|未找到二维码|打开登录页面失败)')],
+    },
+    'publish': {
+        'logger': 'publisher',
+        'sequential': True,
+        'start': [re.compile(r'开始发布笔记: (?P<target>.+) \(账号: (?P<account>.+)\)$')],
+        'success': [re.compile(r'笔记发布成功: (?P<target>.+)$'),
+                    re.compile(r'发布状态检查超时，可能已发布成功: (?P<target>.+)$')],
+        'failure': [re.compile(r'发布笔记 (?P<target>.+?) 时出现错误'),
+                    re.compile(r'(?:登录状态已失效|Cookie不存在，请先登录)，无法发布: (?P<target>.+)$'),
+                    re.compile(r'文案无法发布 \(\w+\): (?P<target>.+)$'),
+                    re.compile(r'(?:文案内容为空|相同内容的文案已经发布过): (?P<target>.+)$'),
+                    re.compile(r'图片无法使用: (?P<target>.+?) \('),
+                    re.compile(r'已熔断，跳过发布: (?P<target>.+)$')],
+    },
+    'comment': {
+        'logger': 'gpt_reply',
+        'sequential': True,
+        'start': [re.compile(r'开始评论笔记: (?P<target>\S+) \(账号: (?P<account>.+)\)$')],
+        'success': [re.compile(r'评论发送成功: (?P<target>\S+)'),
+                    re.compile(r'(?:评论可能已发送，但未找到确认元素|评论发送状态检查超时，可能已成功): (?P<target>\S+)$')],
+        'failure': [re.compile(r'评论笔记 (?P<target>\S+) 时出现错误'),
+                    re.compile(r'(?:登录状态已失效|Cookie不存在，请先登录)，无法评论: (?P<target>\S+)$'),
+                    re.compile(r'已熔断，跳过评论: (?P<target>\S+)$')],
+    },
+}
+OPERATION_NAMES = list(OPERATIONS)
+
+STATUS_FAILED = 0
+STATUS_SUCCESS = 1
+# 下一次同类操作开始时仍没有结果
+STATUS_UNKNOWN = 2
+
+COLUMNS = ('started_at', 'duration', 'operation', 'account', 'status')
+
+# 解析规则变化时递增，旧版本的索引和分片会被丢弃并重新解析
+INDEX_VERSION = 2
+
+
+class LogStatsStore:
+    """日志统计：增量解析 logs/*.log，按文件记录已读到的字节位置，
+    每个日志文件解析出的操作记录按列保存为一个 .npz 分片，汇总时向量化计算"""
+
+    def __init__(self, log_dir: str, store_dir: str):
+        """初始化"""
+        self.log_dir = Path(log_dir)
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.store_dir / "index.json"
+        self.logger = logging.getLogger(__name__)
+        self.index = self._load_index()
+
+    def _load_index(self) -> dict:
+        """加载索引 {'version', 'accounts': [...], 'files': {文件名: {'offset', 'inode', 'open'}}}"""
+        if self.index_file.exists():
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                if index.get('version') == INDEX_VERSION:
+                    return index
+                self.logger.info("日志解析规则已更新，重新解析所有日志")
+            except Exception as e:
+                self.logger.error(f"加载日志统计索引失败，将重新解析: {e}")
+        return {'version': INDEX_VERSION, 'accounts': [], 'files': {}}
+
+    def _save_index(self):
+        tmp_file = self.index_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+
+    def _account_id(self, account_name: str) -> int:
+        accounts = self.index['accounts']
+        if account_name not in accounts:
+            accounts.append(account_name)
+        return accounts.index(account_name)
+
+    def _chunk_file(self, log_name: str) -> Path:
+        return self.store_dir / f"{log_name}.npz"
+
+    @staticmethod
+    def _timestamp(date_part: str, millis: str) -> float:
+        return time.mktime(datetime.strptime(date_part, '%Y-%m-%d %H:%M:%S').timetuple()) + int(millis) / 1000
+
+    @staticmethod
+    def _op_key(operation: str, target: str) -> str:
+        """未结束操作的键：发布按文案文件名（日志中可能是完整路径），评论按笔记链接，登录按账号"""
+        target = target.strip()
+        if operation == 'publish':
+            target = re.split(r'[\\/]', target)[-1]
+        return f"{operation}:{target}"
+
+    def _parse(self, lines, open_ops: dict) -> list:
+        """解析日志行，返回已结束的操作 [(开始时间, 耗时, 操作, 账号, 状态)]；open_ops 为跨批次保留的未结束操作"""
+        rows = []
+
+        def close(key, ended_at, status):
+            op = open_ops.pop(key)
+            rows.append((op['started_at'], ended_at - op['started_at'], op['operation'], op['account'], status))
+
+        for line in lines:
+            match = LINE_PATTERN.match(line)
+            if not match:
+                continue
+            date_part, millis, logger_name, _, message = match.groups()
+
+            for operation, spec in OPERATIONS.items():
+                if logger_name and logger_name != spec['logger']:
+                    continue
+
+                for pattern in spec['start']:
+                    started = pattern.search(message)
+                    if not started:
+                        continue
+                    target = started.group('target')
+                    account = (started.group('account') if 'account' in pattern.groupindex else target).strip()
+                    key = self._op_key(operation, target)
+                    ts = self._timestamp(date_part, millis)
+                    if spec['sequential']:
+                        # 发布/评论逐个进行，新的操作开始时之前仍没有结果的同类操作结果未知
+                        for open_key in [k for k, op in open_ops.items() if op['operation'] == operation]:
+                            close(open_key, ts, STATUS_UNKNOWN)
+                    elif key in open_ops:
+                        # 同一账号登录的两条开始日志属于同一次登录
+                        break
+                    open_ops[key] = {'operation': operation, 'account': account, 'started_at': ts}
+                    break
+                else:
+                    for status, patterns in ((STATUS_SUCCESS, spec['success']), (STATUS_FAILED, spec['failure'])):
+                        for pattern in patterns:
+                            ended = pattern.search(message)
+                            if not ended:
+                                continue
+                            key = self._op_key(operation, ended.group('target'))
+                            if key in open_ops:
+                                close(key, self._timestamp(date_part, millis), status)
+                            break
+        return rows
+
+    def _write_chunk(self, log_name: str, rows: list, reset: bool):
+        """把新解析的记录追加到日志文件对应的分片"""
+        chunk_file = self._chunk_file(log_name)
+        columns = {
+            'started_at': np.array([r[0] for r in rows], dtype=np.float64),
+            'duration': np.array([r[1] for r in rows], dtype=np.float32),
+            'operation': np.array([OPERATION_NAMES.index(r[2]) for r in rows], dtype=np.int8),
+            'account': np.array([self._account_id(r[3]) for r in rows], dtype=np.int32),
+            'status': np.array([r[4] for r in rows], dtype=np.int8),
+        }
+        if chunk_file.exists() and not reset:
+            with np.load(chunk_file) as existing:
+                columns = {name: np.concatenate([existing[name], columns[name]]) for name in COLUMNS}
+        np.savez(chunk_file, **columns)
+
+    def update(self) -> int:
+        """解析所有日志文件中新追加的部分，返回新增的操作记录数"""
+        added = 0
+        for log_file in sorted(self.log_dir.glob("*.log")):
+            stat = log_file.stat()
+            entry = self.index['files'].get(log_file.name)
+            # 文件被替换或截断时从头解析
+            reset = entry is None or entry['inode'] != stat.st_ino or stat.st_size < entry['offset']
+            if reset:
+                entry = {'offset': 0, 'inode': stat.st_ino, 'open': {}}
+            if stat.st_size == entry['offset'] and not reset:
+                continue
+
+            with open(log_file, 'rb') as f:
+                f.seek(entry['offset'])
+                data = f.read()
+            # 只处理完整的行，未写完的最后一行留到下次
+            end = data.rfind(b'\n') + 1
+            lines = data[:end].decode('utf-8', errors='replace').splitlines()
+
+            rows = self._parse(lines, entry['open'])
+            if rows or reset:
+                self._write_chunk(log_file.name, rows, reset)
+            entry['offset'] += end
+            self.index['files'][log_file.name] = entry
+            added += len(rows)
+
+        self._save_index()
+        return added
+
+    def load(self, since: float = None) -> dict:
+        """读取所有分片并合并成列 {列名: 数组}，since 为只保留该时间之后开始的操作"""
+        chunks = []
+        for log_name in self.index['files']:
+            chunk_file = self._chunk_file(log_name)
+            if chunk_file.exists():
+                with np.load(chunk_file) as chunk:
+                    chunks.append({name: chunk[name] for name in COLUMNS})
+        if not chunks:
+            return {name: np.array([]) for name in COLUMNS}
+
+        columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in COLUMNS}
+        if since is not None:
+            mask = columns['started_at'] >= since
+            columns = {name: values[mask] for name, values in columns.items()}
+        return columns
+
+    def summarize(self, since: float = None, by_account: bool = True) -> list:
+        """按 (操作, 账号) 或按操作汇总：次数、失败率、平均/分位数耗时"""
+        columns = self.load(since)
+        if not len(columns['duration']):
+            return []
+
+        accounts = columns['account'] if by_account else np.zeros_like(columns['account'])
+        keys = columns['operation'].astype(np.int64) * (1 << 32) + accounts
+        groups, inverse = np.unique(keys, return_inverse=True)
+
+        counts = np.bincount(inverse)
+        failures = np.bincount(inverse, weights=columns['status'] == STATUS_FAILED)
+        unknown = np.bincount(inverse, weights=columns['status'] == STATUS_UNKNOWN)
+        total_duration = np.bincount(inverse, weights=columns['duration'])
+
+        # 按组排序耗时，一次性算出所有组的分位数
+        order = np.lexsort((columns['duration'], inverse))
+        sorted_durations = columns['duration'][order]
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        def percentile(q):
+            positions = starts + np.floor((counts - 1) * q / 100).astype(np.int64)
+            return sorted_durations[positions]
+
+        p50, p90, p95 = percentile(50), percentile(90), percentile(95)
+        maximum = sorted_durations[starts + counts - 1]
+
+        summary = []
+        for i, key in enumerate(groups):
+            decided = counts[i] - unknown[i]
+            summary.append({
+                'operation': OPERATION_NAMES[int(key >> 32)],
+                'account': self.index['accounts'][int(key & 0xFFFFFFFF)] if by_account else '全部',
+                'count': int(counts[i]),
+                'failure_rate': round(float(failures[i] / decided), 3) if decided else None,
+                'unknown': int(unknown[i]),
+                'mean': round(float(total_duration[i] / counts[i]), 1),
+                'p50': round(float(p50[i]), 1),
+                'p90': round(float(p90[i]), 1),
+                'p95': round(float(p95[i]), 1),
+                'max': round(float(maximum[i]), 1),
+            })
+        return summary
@@ -2,10 +2,18 @@ import json
 import os
 import time
 import random
+import threading
 from pathlib import Path
+from contextlib import contextmanager
 from playwright.sync_api import sync_playwright, Page
 import yaml
 import logging
+import clock
+from selector_registry import SelectorRegistry
+from timeout_manager import TimeoutManager
+from qr_terminal import render_qr_to_text
+from browser_pool import open_account_page
+from session_probe import SessionProbe
 
 class LoginManager:
     def __init__(self, config_path: str = "config.yaml"):
@@ -15,6 +23,42 @@ class LoginManager:
         self.cookies_dir = Path(self.config['paths']['cookies'])
         self.cookies_dir.mkdir(exist_ok=True)
         
+        # 已保存Cookie的指纹，用于判断会话是否被服务器更新
+        self._cookie_lock = threading.RLock()
+        self._saved_cookies = {}
+        # 账号最近一次成功操作的时间
+        self.last_active = {}
+        # 从浏览器上下文写回Cookie后Cookie文件的修改时间
+        self.synced_mtime = {}
+        # 账号名 -> 浏览器会话锁，同一账号同一时刻只有一个线程在浏览器中操作
+        self._session_locks = {}
+        # 常驻浏览器池（守护进程模式下设置）
+        self.browser_pool = None
+        # 站点地址（可指向本地模拟站点）
+        self.home_url = self.config.get('sites', {}).get('home', "https://www.xiaohongshu.com").rstrip('/')
+        
+        # 选择器命中统计，所有模块共享
+        data_dir = Path(self.config['paths'].get('data', 'data/'))
+        self.selectors = SelectorRegistry.shared(
+            data_dir / "selector_stats.json",
+            self.config['browser'].get('selector_timeout', 1500)
+        )
+        
+        # 按步骤耗时自适应的超时时间，所有模块共享
+        self.timeouts = TimeoutManager.shared(
+            data_dir / "step_latency.json",
+            self.config.get('timeouts', {})
+        )
+        
+        # 不启动浏览器的登录状态探测
+        probe_settings = self.config.get('login', {}).get('session_probe', {})
+        self.session_probe = None
+        if probe_settings.get('enabled', True):
+            self.session_probe = SessionProbe(
+                probe_settings,
+                self.config.get('cookie_refresh', {}).get('auth_cookies', ['web_session'])
+            )
+        
     def _load_config(self, config_path: str) -> dict:
         """加载配置文件"""
         with open(config_path, 'r', encoding='utf-8') as f:
@@ -52,16 +96,65 @@ class LoginManager:
         """保存指定账号的Cookie"""
         cookie_file = self.cookies_dir / f"{account_name}_cookies.json"
         try:
-            with open(cookie_file, 'w', encoding='utf-8') as f:
-                json.dump(cookies, f, ensure_ascii=False, indent=2)
+            with self._cookie_lock:
+                with open(cookie_file, 'w', encoding='utf-8') as f:
+                    json.dump(cookies, f, ensure_ascii=False, indent=2)
+                self._saved_cookies[account_name] = self._cookie_fingerprint(cookies)
             self.logger.info(f"成功保存账号 {account_name} 的Cookie")
         except Exception as e:
             self.logger.error(f"保存Cookie失败: {e}")
     
+    @staticmethod
+    def _cookie_fingerprint(cookies: list) -> tuple:
+        """Cookie指纹（过期时间按小时取整，忽略每次请求都会滚动的细微变化）"""
+        return tuple(sorted(
+            (c.get('name'), c.get('domain'), c.get('path'), c.get('value'), int(c.get('expires', -1) // 3600))
+            for c in cookies
+        ))
+    
+    def sync_cookies(self, account_name: str, context) -> bool:
+        """成功操作后把上下文中被服务器更新的Cookie写回文件，未变化时不写盘，返回是否写入"""
+        self.last_active[account_name] = clock.now()
+        try:
+            cookies = context.cookies()
+        except Exception as e:
+            self.logger.warning(f"读取账号 {account_name} 的Cookie失败: {e}")
+            return False
+        if not cookies:
+            return False
+        
+        fingerprint = self._cookie_fingerprint(cookies)
+        with self._cookie_lock:
+            previous = self._saved_cookies.get(account_name)
+            if previous is None:
+                previous = self._cookie_fingerprint(self.load_cookies(account_name))
+                self._saved_cookies[account_name] = previous
+            if fingerprint == previous:
+                return False
+            
+            self.logger.info(f"账号 {account_name} 的会话已被服务器更新，写回Cookie")
+            self.save_cookies(account_name, cookies)
+            cookie_file = self.cookies_dir / f"{account_name}_cookies.json"
+            if cookie_file.exists():
+                self.synced_mtime[account_name] = cookie_file.stat().st_mtime
+        return True
+    
+    @contextmanager
+    def account_session(self, account_name: str, wait: bool = True):
+        """占用账号的浏览器会话，产出是否占用成功；wait 为 False 时账号正在被其他线程使用则立即产出 False"""
+        with self._cookie_lock:
+            lock = self._session_locks.setdefault(account_name, threading.RLock())
+        acquired = lock.acquire(blocking=wait)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                lock.release()
+    
     def random_delay(self, min_delay: int = 1000, max_delay: int = 3000):
         """随机延迟，模拟人工操作"""
         delay = random.randint(min_delay, max_delay)
-        time.sleep(delay / 1000)
+        clock.sleep(delay / 1000)
     
     def human_like_typing(self, page: Page, selector: str, text: str):
         """模拟人工输入文字"""
@@ -70,7 +163,7 @@ class LoginManager:
         
         for char in text:
             page.type(selector, char)
-            time.sleep(random.randint(50, 150) / 1000)  # 随机输入间隔
+            clock.sleep(random.randint(50, 150) / 1000)  # 随机输入间隔
     
     def login_account(self, account: dict) -> bool:
         """登录指定账号（扫码登录）"""
@@ -93,7 +186,7 @@ class LoginManager:
             
             try:
                 # 访问小红书登录页面
-                page.goto("https://www.xiaohongshu.com/login")
+                page.goto(f"{self.home_url}/login")
                 self.random_delay(2000, 4000)
                 
                 # 等待页面加载
@@ -101,16 +194,16 @@ class LoginManager:
                 
                 # 查找并点击扫码登录按钮（如果存在）
                 try:
-                    qr_login_btn = page.locator("text=扫码登录, text=二维码登录, .qr-login-btn").first
-                    if qr_login_btn.is_visible():
+                    qr_login_btn = self.selectors.find(page, 'qr_login_button')
+                    if qr_login_btn is not None:
                         qr_login_btn.click()
                         self.random_delay(1000, 2000)
                 except:
                     pass
                 
                 # 等待二维码出现
-                qr_code = page.locator('.qr-code, .qrcode, [data-testid="qr-code"]').first
-                if qr_code.is_visible():
+                qr_code = self.selectors.find(page, 'qr_code')
+                if qr_code is not None:
                     self.logger.info(f"请使用小红书APP扫描二维码登录账号: {account_name}")
                     print(f"\n📱 请使用小红书APP扫描二维码登录账号: {account_name}")
                     print("⏳ 等待扫码登录...")
@@ -126,8 +219,7 @@ class LoginManager:
                             current_url = page.url
                             if "login" not in current_url.lower():
                                 # 进一步检查是否真的登录成功
-                                user_avatar = page.locator('[data-testid="user-avatar"], .avatar, .user-avatar').first
-                                if user_avatar.is_visible():
+                                if self.selectors.is_visible(page, 'user_avatar'):
                                     # 保存Cookie
                                     cookies = context.cookies()
                                     self.save_cookies(account_name, cookies)
@@ -143,8 +235,7 @@ class LoginManager:
                             else:
                                 # URL已变化，可能登录成功
                                 time.sleep(3)  # 等待页面完全加载
-                                user_avatar = page.locator('[data-testid="user-avatar"], .avatar, .user-avatar').first
-                                if user_avatar.is_visible():
+                                if self.selectors.is_visible(page, 'user_avatar'):
                                     # 保存Cookie
                                     cookies = context.cookies()
                                     self.save_cookies(account_name, cookies)
@@ -201,6 +292,130 @@ class LoginManager:
         
         return results
     
+    def _show_qr_code(self, account_name: str, qr_code) -> Path:
+        """保存二维码截图，并按配置在终端中渲染"""
+        login_config = self.config.get('login', {})
+        qr_dir = Path(login_config.get('qr_dir', 'data/qrcodes'))
+        qr_dir.mkdir(parents=True, exist_ok=True)
+        
+        qr_file = qr_dir / f"{account_name}_qr.png"
+        qr_code.screenshot(path=str(qr_file))
+        
+        print(f"\n📱 请使用小红书APP扫描二维码登录账号: {account_name}")
+        print(f"🖼️  二维码图片: {qr_file}")
+        if login_config.get('qr_terminal', True):
+            text = render_qr_to_text(qr_file)
+            if text:
+                print(text)
+            else:
+                print("⚠️  无法在终端中渲染二维码，请打开图片扫码")
+        return qr_file
+    
+    def accounts_needing_login(self) -> list:
+        """没有Cookie或登录状态已失效、需要扫码登录的账号"""
+        status = self.verify_all_accounts()
+        return [account for account in self.config['accounts'] if not status[account['name']]]
+    
+    def login_accounts_concurrently(self, accounts: list = None) -> dict:
+        """同时为多个账号打开扫码登录（同一浏览器的独立上下文），无需交互确认
+
+        默认只为需要登录的账号打开扫码，登录状态有效的账号直接记为成功。
+        """
+        results = {}
+        if accounts is None:
+            accounts = self.accounts_needing_login()
+            pending = {account['name'] for account in accounts}
+            for account in self.config['accounts']:
+                results[account['name']] = account['name'] not in pending
+                if results[account['name']]:
+                    self.logger.info(f"账号 {account['name']} 登录状态有效，跳过扫码登录")
+        if not accounts:
+            return results
+        
+        login_config = self.config.get('login', {})
+        max_wait_time = login_config.get('max_wait_seconds', 120)
+        results.update({account['name']: False for account in accounts})
+        
+        self.logger.info(f"开始并发扫码登录 {len(accounts)} 个账号")
+        
+        with sync_playwright() as p:
+            browser = p.chromium.launch(
+                headless=login_config.get('headless', False),
+                slow_mo=self.config['browser']['slow_mo']
+            )
+            
+            # 账号名 -> (context, page)
+            opened = {}
+            sessions = {}
+            
+            try:
+                # 先为所有账号发起导航（收到响应即返回），各页面在浏览器中同时加载
+                for account in accounts:
+                    account_name = account['name']
+                    context = browser.new_context(
+                        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+                    )
+                    page = context.new_page()
+                    page.set_default_timeout(self.config['browser']['timeout'])
+                    try:
+                        page.goto(f"{self.home_url}/login", wait_until="commit")
+                        opened[account_name] = (context, page)
+                    except Exception as e:
+                        self.logger.error(f"账号 {account_name} 打开登录页面失败: {e}")
+                        context.close()
+                
+                for account_name, (context, page) in opened.items():
+                    try:
+                        page.wait_for_load_state("networkidle")
+                        
+                        qr_login_btn = self.selectors.find(page, 'qr_login_button')
+                        if qr_login_btn is not None:
+                            qr_login_btn.click()
+                        
+                        qr_code = self.selectors.find(page, 'qr_code')
+                        if qr_code is None:
+                            self.logger.error(f"账号 {account_name} 未找到二维码，可能页面结构已变化")
+                            context.close()
+                            continue
+                        
+                        self.logger.info(f"请使用小红书APP扫描二维码登录账号: {account_name}")
+                        self._show_qr_code(account_name, qr_code)
+                        sessions[account_name] = (context, page)
+                    except Exception as e:
+                        self.logger.error(f"账号 {account_name} 打开登录页面失败: {e}")
+                        context.close()
+                
+                if sessions:
+                    print(f"\n⏳ 等待扫码登录（共 {len(sessions)} 个账号，最多 {max_wait_time} 秒）...")
+                
+                # 依次等待各页面离开登录页（导航事件），等待某个账号期间其他页面照常导航，
+                # 轮到它们时已满足条件会立即返回，总等待时间取决于最后一个扫码的账号
+                deadline = time.time() + max_wait_time
+                
+                def remaining_ms():
+                    # Playwright 中超时为0表示不限时，剩余时间至少取1毫秒
+                    return max(int((deadline - time.time()) * 1000), 1)
+                
+                for account_name, (context, page) in sessions.items():
+                    try:
+                        page.wait_for_url(lambda url: "login" not in url.lower(), timeout=remaining_ms())
+                        if self.selectors.find(page, 'user_avatar', timeout=remaining_ms()) is None:
+                            raise TimeoutError("未找到用户头像")
+                    except Exception as e:
+                        self.logger.error(f"账号 {account_name} 扫码登录超时: {e}")
+                        print(f"❌ 账号 {account_name} 登录超时，请重试")
+                        continue
+                    
+                    self.save_cookies(account_name, context.cookies())
+                    self.logger.info(f"账号 {account_name} 扫码登录成功")
+                    print(f"✅ 账号 {account_name} 登录成功！")
+                    results[account_name] = True
+                    context.close()
+            finally:
+                browser.close()
+        
+        return results
+    
     def login_single_account(self, account_name: str) -> bool:
         """登录单个指定账号"""
         account = None
@@ -215,29 +430,63 @@ class LoginManager:
         
         return self.login_account(account)
     
-    def verify_login_status(self, account_name: str) -> bool:
-        """验证账号登录状态"""
+    def verify_login_status(self, account_name: str, use_probe: bool = True) -> bool:
+        """验证账号登录状态：先用HTTP会话探测，无法判断时再打开浏览器检查"""
         cookies = self.load_cookies(account_name)
         if not cookies:
             return False
         
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context()
-            
-            # 添加Cookie
-            context.add_cookies(cookies)
-            
-            page = context.new_page()
-            
+        if use_probe and self.session_probe:
+            valid = self.session_probe.probe(cookies)
+            if valid is not None:
+                self._log_probe_result(account_name, valid)
+                return valid
+        
+        return self._verify_in_browser(account_name, cookies)
+    
+    def _log_probe_result(self, account_name: str, valid: bool):
+        """记录会话探测结果"""
+        if valid:
+            self.logger.info(f"账号 {account_name} 登录状态有效（会话探测）")
+        else:
+            self.logger.warning(f"账号 {account_name} 登录状态已失效（会话探测）")
+    
+    def verify_all_accounts(self) -> dict:
+        """验证所有账号：并行探测会话，只有无法判断的账号才逐个打开浏览器检查"""
+        account_cookies = {}
+        results = {}
+        for account in self.config['accounts']:
+            cookies = self.load_cookies(account['name'])
+            if cookies:
+                account_cookies[account['name']] = cookies
+            else:
+                results[account['name']] = False
+        
+        probed = self.session_probe.probe_many(account_cookies) if self.session_probe else {}
+        for account_name, cookies in account_cookies.items():
+            valid = probed.get(account_name)
+            if valid is None:
+                valid = self._verify_in_browser(account_name, cookies)
+            else:
+                self._log_probe_result(account_name, valid)
+            results[account_name] = valid
+        
+        return {account['name']: results[account['name']] for account in self.config['accounts']}
+    
+    def _verify_in_browser(self, account_name: str, cookies: list) -> bool:
+        """打开首页检查登录状态，有效时写回服务器更新过的Cookie"""
+        with self.account_session(account_name), \
+                open_account_page(self.config, account_name, cookies, self.browser_pool,
+                                  headless=True, slow_mo=0) as (context, page):
             try:
-                page.goto("https://www.xiaohongshu.com")
+                with self.timeouts.step('home_page_load', self.config['browser']['timeout']) as timeout:
+                    page.goto(self.home_url, timeout=timeout)
                 page.wait_for_load_state("networkidle")
                 
                 # 检查是否已登录（查找用户头像或用户名等元素）
-                user_avatar = page.locator('[data-testid="user-avatar"], .avatar, .user-avatar').first
-                if user_avatar.is_visible():
+                if self.selectors.find(page, 'user_avatar') is not None:
                     self.logger.info(f"账号 {account_name} 登录状态有效")
+                    self.sync_cookies(account_name, context)
                     return True
                 else:
                     self.logger.warning(f"账号 {account_name} 登录状态已失效")
@@ -246,8 +495,6 @@ class LoginManager:
             except Exception as e:
                 self.logger.error(f"验证登录状态时出错: {e}")
                 return False
-            finally:
-                browser.close()
 
 if __name__ == "__main__":
     # 测试登录功能
@@ -6,25 +6,60 @@
 """
 
 import argparse
-import sys
+import time
+import hashlib
 import logging
 from pathlib import Path
 from datetime import datetime
+from urllib.parse import urlparse
+import clock
+import profiler
 
 from login_manager import LoginManager
 from publisher import Publisher
 from gpt_reply import GPTReply
+from run_report import RunReport, make_result
+from cookie_refresher import CookieRefresher
+from daemon import JobDaemon
+from browser_pool import BrowserPool
+from work_queue import create_work_queue, QueueWorker
+from comment_history import extract_note_id
+from target_source import open_target_source
+from log_stats import LogStatsStore
+from circuit_breaker import CircuitBreaker, format_snapshot
+
+# 小红书正式站点域名，虚拟时钟下不允许直接访问
+PRODUCTION_DOMAIN = "xiaohongshu.com"
+
+
+def is_live_site(url: str) -> bool:
+    """链接是否指向小红书正式站点"""
+    host = urlparse(url).hostname or ""
+    return host == PRODUCTION_DOMAIN or host.endswith("." + PRODUCTION_DOMAIN)
+
 
 class XiaohongshuBot:
-    def __init__(self, config_path: str = "config.yaml"):
+    def __init__(self, config_path: str = "config.yaml", report_path: str = None):
         """初始化小红书机器人"""
         self.config_path = config_path
         self.setup_logging()
         
-        # 初始化各个模块
+        # 发布/评论结果逐条追加到JSONL报告
+        if report_path is None:
+            report_path = Path("logs") / f'report_{datetime.now().strftime("%Y%m%d")}.jsonl'
+        self.report_path = report_path
+        
+        # 初始化各个模块（共享同一个登录管理器，以便统一跟踪账号会话）
         self.login_manager = LoginManager(config_path)
-        self.publisher = Publisher(config_path)
-        self.gpt_reply = GPTReply(config_path)
+        self.publisher = Publisher(config_path, self.login_manager)
+        self.gpt_reply = GPTReply(config_path, self.login_manager)
+        self.cookie_refresher = CookieRefresher(
+            self.login_manager,
+            self.login_manager.config.get('cookie_refresh', {})
+        )
+        
+        # --simulate 下拒绝执行指向正式站点的任务（守护进程和队列节点的任务在运行时才知道目标）
+        self.block_live_sites = False
         
         self.logger = logging.getLogger(__name__)
     
@@ -42,10 +77,13 @@ class XiaohongshuBot:
             ]
         )
     
-    def login_all_accounts(self):
+    def login_all_accounts(self, concurrent=False):
         """登录所有账号"""
         self.logger.info("开始登录所有账号...")
-        results = self.login_manager.login_all_accounts()
+        if concurrent or self.login_manager.config.get('login', {}).get('concurrent', False):
+            results = self.login_manager.login_accounts_concurrently()
+        else:
+            results = self.login_manager.login_all_accounts()
         
         print("\n登录结果:")
         for account, success in results.items():
@@ -54,33 +92,52 @@ class XiaohongshuBot:
         
         return results
     
+    def stream_results(self, title: str, records) -> tuple:
+        """逐条输出结果并写入运行报告，返回 (成功数, 总数)"""
+        print(f"\n{title}:")
+        success_count = 0
+        total = 0
+        
+        with RunReport(self.report_path) as report:
+            for record in records:
+                report.write(record)
+                total += 1
+                if record['status'] == 'success':
+                    success_count += 1
+                    status = "✅ 成功"
+                else:
+                    status = f"❌ 失败 ({record['error']})" if record['error'] else "❌ 失败"
+                print(f"{record['account']}_{record['target']}: {status} [{record['duration']}s]")
+        
+        self.print_circuit_breakers()
+        return success_count, total
+    
+    def print_circuit_breakers(self, tripped_only: bool = True):
+        """输出熔断器状态（默认只输出熔断过的）"""
+        snapshots = CircuitBreaker.snapshot_all(tripped_only)
+        if not snapshots:
+            return
+        print("熔断器:")
+        for snapshot in snapshots:
+            print(f"  ⚡ {format_snapshot(snapshot)}")
+    
     def publish_notes(self, max_posts=None):
         """发布笔记"""
         self.logger.info("开始发布笔记...")
-        results = self.publisher.publish_all_drafts(max_posts)
-        
-        print("\n发布结果:")
-        for key, success in results.items():
-            status = "✅ 成功" if success else "❌ 失败"
-            print(f"{key}: {status}")
-        
-        return results
+        return self.stream_results("发布结果", self.publisher.iter_publish_drafts(max_posts))
     
-    def reply_comments(self, note_urls=None, max_comments=None):
+    def reply_comments(self, note_urls=None, max_comments=None, targets_file=None):
         """回复评论"""
         self.logger.info("开始回复评论...")
         
-        if note_urls is None:
-            results = self.gpt_reply.reply_to_target_notes()
+        if targets_file:
+            records = self.gpt_reply.iter_reply_to_file(targets_file, max_comments)
+        elif note_urls is None:
+            records = self.gpt_reply.iter_reply_to_target_notes()
         else:
-            results = self.gpt_reply.reply_to_multiple_notes(note_urls, max_comments)
-        
-        print("\n评论结果:")
-        for key, success in results.items():
-            status = "✅ 成功" if success else "❌ 失败"
-            print(f"{key}: {status}")
+            records = self.gpt_reply.iter_reply_to_notes(note_urls, max_comments)
         
-        return results
+        return self.stream_results("评论结果", records)
     
     def run_full_workflow(self):
         """运行完整工作流程"""
@@ -102,13 +159,13 @@ class XiaohongshuBot:
         print("\n" + "=" * 50)
         print("步骤 2: 发布笔记")
         print("=" * 50)
-        publish_results = self.publish_notes()
+        publish_success, publish_total = self.publish_notes()
         
         # 3. 回复评论
         print("\n" + "=" * 50)
         print("步骤 3: 回复评论")
         print("=" * 50)
-        comment_results = self.reply_comments()
+        comment_success, comment_total = self.reply_comments()
         
         # 4. 总结报告
         print("\n" + "=" * 50)
@@ -116,15 +173,181 @@ class XiaohongshuBot:
         print("=" * 50)
         
         login_success = sum(1 for success in login_results.values() if success)
-        publish_success = sum(1 for success in publish_results.values() if success)
-        comment_success = sum(1 for success in comment_results.values() if success)
         
         print(f"登录成功: {login_success}/{len(login_results)}")
-        print(f"发布成功: {publish_success}/{len(publish_results)}")
-        print(f"评论成功: {comment_success}/{len(comment_results)}")
+        print(f"发布成功: {publish_success}/{publish_total}")
+        print(f"评论成功: {comment_success}/{comment_total}")
+        print(f"详细结果: {self.report_path}")
+        
+        self.print_circuit_breakers(tripped_only=False)
+        self.report_failing_selectors()
         
         return True
     
+    def refresh_cookies(self):
+        """刷新即将过期或长时间空闲账号的会话"""
+        self.logger.info("开始刷新账号会话...")
+        results = self.cookie_refresher.refresh_due_accounts()
+        
+        print("\n会话刷新结果:")
+        if not results:
+            print("没有需要刷新的账号")
+        for account, valid in results.items():
+            status = "✅ 有效" if valid else "❌ 已失效，请重新扫码登录"
+            print(f"{account}: {status}")
+        
+        return results
+    
+    def verify_accounts(self):
+        """验证所有账号的登录状态（并行会话探测，必要时打开浏览器确认）"""
+        self.logger.info("开始验证账号登录状态...")
+        started_at = time.time()
+        results = self.login_manager.verify_all_accounts()
+        
+        print("\n登录状态验证结果:")
+        for account, valid in results.items():
+            status = "✅ 有效" if valid else "❌ 已失效，请重新扫码登录"
+            print(f"{account}: {status}")
+        print(f"耗时: {time.time() - started_at:.1f}秒")
+        
+        return results
+    
+    def show_stats(self, days=None):
+        """增量解析日志，按账号和操作汇总耗时与失败率"""
+        config = self.login_manager.config
+        store = LogStatsStore(config['paths']['logs'], Path(config['paths'].get('data', 'data/')) / "log_stats")
+        added = store.update()
+        self.logger.info(f"日志统计新增 {added} 条操作记录")
+        
+        since = time.time() - days * 86400 if days else None
+        scope = f"最近 {days} 天" if days else "全部日志"
+        for title, by_account in (("按操作", False), ("按账号和操作", True)):
+            summary = store.summarize(since, by_account)
+            print(f"\n📊 {title}统计（{scope}，耗时单位: 秒）")
+            if not summary:
+                print("   没有可统计的操作记录")
+                continue
+            print(f"{'操作':<8}{'账号':<12}{'次数':>6}{'失败率':>8}{'未知':>6}{'平均':>8}{'p50':>8}{'p90':>8}{'p95':>8}{'最大':>8}")
+            for row in summary:
+                failure_rate = f"{row['failure_rate']:.0%}" if row['failure_rate'] is not None else "-"
+                print(f"{row['operation']:<8}{row['account']:<12}{row['count']:>6}{failure_rate:>8}{row['unknown']:>6}"
+                      f"{row['mean']:>8}{row['p50']:>8}{row['p90']:>8}{row['p95']:>8}{row['max']:>8}")
+    
+    def comment_target_source(self, note_urls=None, targets_file=None):
+        """评论目标笔记来源：--targets-file、--note-urls，否则为配置中的目标文件或 target_notes"""
+        if targets_file:
+            return open_target_source(targets_file)
+        if note_urls:
+            return open_target_source(note_urls)
+        return open_target_source(
+            self.gpt_reply.target_source_file() or self.login_manager.config['commenting']['target_notes']
+        )
+    
+    def live_sites(self, mode: str, note_urls=None, targets_file=None) -> list:
+        """本次运行会访问的小红书正式站点域名（站点、登录状态探测接口、评论目标笔记）"""
+        urls = [self.login_manager.home_url, self.publisher.creator_url]
+        if self.login_manager.session_probe:
+            urls.append(self.login_manager.session_probe.endpoint)
+        if mode in ("comment", "full", "enqueue"):
+            # 不调用 commit，不影响目标文件的读取进度
+            urls.extend(self.comment_target_source(note_urls, targets_file))
+        
+        hosts = []
+        for url in urls:
+            host = urlparse(url).hostname
+            if is_live_site(url) and host not in hosts:
+                hosts.append(host)
+        return hosts
+    
+    def run_job(self, request: dict) -> dict:
+        """执行单个发布/评论/验证任务，返回结果记录（守护进程和队列工作节点共用）"""
+        job_type = request['type']
+        account_name = request['account']
+        started_at = clock.now()
+        
+        if self.block_live_sites and job_type == 'comment' and is_live_site(request['note_url']):
+            self.logger.error(f"--simulate 下拒绝评论正式站点的笔记: {request['note_url']}")
+            return make_result('comment', account_name, request['note_url'], False, started_at, "LiveSiteBlocked")
+        
+        if job_type == 'publish':
+            draft_file = Path(request['draft'])
+            success = self.publisher.publish_note(account_name, draft_file)
+            record = make_result('publish', account_name, draft_file.name, success, started_at,
+                                 self.publisher.last_error)
+            if self.publisher.upload_metrics:
+                record['uploads'] = self.publisher.upload_metrics
+            return record
+        
+        if job_type == 'comment':
+            success = self.gpt_reply.reply_to_note(account_name, request['note_url'])
+            return make_result('comment', account_name, request['note_url'], success, started_at,
+                               self.gpt_reply.last_error)
+        
+        success = self.login_manager.verify_login_status(account_name)
+        return make_result('verify', account_name, account_name, success, started_at)
+    
+    def enqueue_jobs(self, note_urls=None, targets_file=None, node_id=None):
+        """把待发布文案和待评论笔记加入共享任务队列（可在任意节点上重复运行，不会重复入队）"""
+        work_queue = create_work_queue(self.login_manager.config, node_id)
+        account_names = [account['name'] for account in self.login_manager.config['accounts']]
+        publish_count = 0
+        comment_count = 0
+        
+        # 文案按顺序轮流分配给各账号，按内容哈希去重
+        for index, draft_file in enumerate(sorted(self.publisher.get_draft_files())):
+            content = self.publisher.read_draft_content(draft_file)
+            if not content:
+                continue
+            dedupe_key = f"publish:{hashlib.sha1(content.encode('utf-8')).hexdigest()}"
+            account_name = account_names[index % len(account_names)]
+            if work_queue.enqueue('publish', account_name, {'draft': str(draft_file)}, dedupe_key):
+                publish_count += 1
+        
+        # 每个账号对每篇笔记一个评论任务
+        source = self.comment_target_source(note_urls, targets_file)
+        for note_url in source:
+            for account_name in account_names:
+                if self.gpt_reply.comment_history.has_commented(account_name, note_url):
+                    continue
+                dedupe_key = f"comment:{account_name}:{extract_note_id(note_url)}"
+                if work_queue.enqueue('comment', account_name, {'note_url': note_url}, dedupe_key):
+                    comment_count += 1
+        source.commit()
+        
+        print(f"✅ 已入队: 发布任务 {publish_count} 个，评论任务 {comment_count} 个")
+        print(f"📊 队列状态: {work_queue.stats()}")
+    
+    def run_worker(self, node_id=None, exit_when_idle=False):
+        """作为队列工作节点运行：按账号租约领取任务，浏览器常驻"""
+        work_queue = create_work_queue(self.login_manager.config, node_id)
+        settings = self.login_manager.config.get('work_queue', {})
+        worker = QueueWorker(work_queue, self.run_job, settings.get('poll_interval_seconds', 5))
+        
+        pool = BrowserPool(self.login_manager.config, self.login_manager)
+        pool.start()
+        for module in (self.login_manager, self.publisher, self.gpt_reply):
+            module.browser_pool = pool
+        
+        try:
+            return self.stream_results(f"节点 {work_queue.node_id} 执行结果", worker.run(exit_when_idle))
+        finally:
+            pool.stop()
+    
+    def run_daemon(self):
+        """以守护进程方式运行，保持浏览器常驻并接收任务"""
+        self.logger.info("启动守护进程...")
+        JobDaemon(self).serve_forever()
+    
+    def report_failing_selectors(self):
+        """输出最近开始失效的页面选择器"""
+        failing = self.login_manager.selectors.failing_selectors()
+        if not failing:
+            return
+        
+        print("\n⚠️  以下选择器最近连续失败，页面结构可能已变化:")
+        for name, selector, misses in failing:
+            print(f"   - {name}: {selector} (连续失败 {misses} 次)")
+    
     def create_sample_files(self):
         """创建示例文件"""
         self.logger.info("创建示例文件...")
@@ -145,12 +368,22 @@ def main():
     """主函数"""
     parser = argparse.ArgumentParser(description="小红书自动运营系统")
     parser.add_argument("--config", default="config.yaml", help="配置文件路径")
-    parser.add_argument("--mode", choices=["login", "publish", "comment", "full", "setup", "qr-login"], 
+    parser.add_argument("--mode", choices=["login", "publish", "comment", "full", "setup", "qr-login", "refresh", "daemon",
+                                           "enqueue", "worker", "verify", "stats"], 
                        default="full", help="运行模式")
     parser.add_argument("--max-posts", type=int, help="最大发帖数量")
     parser.add_argument("--max-comments", type=int, help="最大评论数量")
     parser.add_argument("--note-urls", nargs="+", help="目标笔记链接列表")
+    parser.add_argument("--targets-file", type=str, help="目标笔记文件（.jsonl 或 .csv），逐行读取并支持断点续跑")
     parser.add_argument("--account", type=str, help="指定账号名称（用于qr-login模式）")
+    parser.add_argument("--concurrent", action="store_true", help="同时为所有账号打开扫码登录（用于login模式）")
+    parser.add_argument("--node-id", type=str, help="队列工作节点ID（默认 主机名-随机后缀）")
+    parser.add_argument("--exit-when-idle", action="store_true", help="队列中没有可领取的任务时退出（用于worker模式）")
+    parser.add_argument("--days", type=int, help="只统计最近N天的操作（用于stats模式）")
+    parser.add_argument("--simulate", action="store_true", help="使用虚拟时钟运行：所有刻意等待立即完成，结束时统计等待与实际工作的时间")
+    parser.add_argument("--allow-live-sites", action="store_true", help="确认在 --simulate 下访问小红书正式站点（所有延迟和发帖间隔都会被跳过）")
+    parser.add_argument("--profile", action="store_true", help="采样分析整个运行并输出火焰图折叠栈，同时保留慢操作和失败操作的Playwright追踪")
+    parser.add_argument("--report", type=str, help="发布/评论结果JSONL报告路径（默认 logs/report_YYYYMMDD.jsonl）")
     
     args = parser.parse_args()
     
@@ -160,8 +393,35 @@ def main():
         print("请先运行: python main.py --mode setup")
         return
     
+    # 虚拟时钟需在创建各模块前切换
+    if args.simulate:
+        clock.use_clock(clock.SimulatedClock())
+    
     # 创建机器人实例
-    bot = XiaohongshuBot(args.config)
+    bot = XiaohongshuBot(args.config, args.report)
+    
+    # 虚拟时钟会跳过所有拟人延迟和发帖/评论间隔，只允许对本地模拟站点使用
+    if args.simulate and args.mode not in ("setup", "stats") and not args.allow_live_sites:
+        live_sites = bot.live_sites(args.mode, args.note_urls, args.targets_file)
+        if live_sites:
+            print(f"❌ --simulate 会跳过所有延迟和发帖/评论间隔，但本次运行仍会访问正式站点: {', '.join(live_sites)}")
+            print("请把 sites、login.session_probe.endpoint 和评论目标笔记指向本地模拟站点；确需访问正式站点请加 --allow-live-sites")
+            return
+        bot.block_live_sites = True
+    
+    # 性能分析：采样调用栈，慢操作和失败操作保留Playwright追踪
+    sampler = None
+    if args.profile:
+        settings = bot.login_manager.config.get('profiling', {})
+        profile_dir = Path(settings.get('output_dir', 'logs/profiles'))
+        profiler.enable_tracing(profile_dir / "traces", settings.get('trace_threshold_seconds', 90))
+        sampler = profiler.SamplingProfiler(settings.get('sample_interval_ms', 5))
+        sampler.start()
+    
+    # 长时间运行的模式在后台保持账号会话
+    refresh_config = bot.login_manager.config.get('cookie_refresh', {})
+    if args.mode in ("publish", "comment", "full", "daemon", "worker") and refresh_config.get('enabled', False):
+        bot.cookie_refresher.start()
     
     try:
         if args.mode == "setup":
@@ -170,7 +430,7 @@ def main():
             
         elif args.mode == "login":
             # 仅登录
-            bot.login_all_accounts()
+            bot.login_all_accounts(args.concurrent)
             
         elif args.mode == "qr-login":
             # 扫码登录指定账号
@@ -189,17 +449,58 @@ def main():
             
         elif args.mode == "comment":
             # 仅评论
-            bot.reply_comments(args.note_urls, args.max_comments)
+            bot.reply_comments(args.note_urls, args.max_comments, args.targets_file)
             
         elif args.mode == "full":
             # 完整流程
             bot.run_full_workflow()
             
+        elif args.mode == "refresh":
+            # 刷新即将过期的会话
+            bot.refresh_cookies()
+            
+        elif args.mode == "verify":
+            # 验证所有账号登录状态
+            bot.verify_accounts()
+            
+        elif args.mode == "stats":
+            # 日志统计
+            bot.show_stats(args.days)
+            
+        elif args.mode == "daemon":
+            # 守护进程
+            bot.run_daemon()
+            
+        elif args.mode == "enqueue":
+            # 加入共享任务队列
+            bot.enqueue_jobs(args.note_urls, args.targets_file, args.node_id)
+            
+        elif args.mode == "worker":
+            # 队列工作节点
+            bot.run_worker(args.node_id, args.exit_when_idle)
+            
     except KeyboardInterrupt:
         print("\n⚠️  用户中断执行")
     except Exception as e:
         print(f"❌ 执行过程中出现错误: {e}")
         logging.error(f"执行错误: {e}", exc_info=True)
+    finally:
+        bot.cookie_refresher.stop()
+        bot.gpt_reply.close()
+        bot.login_manager.selectors.flush()
+        if sampler:
+            sampler.stop()
+            output = sampler.write(profile_dir / f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded")
+            print(f"\n🔥 性能分析: {sampler.sample_count} 次采样，折叠栈已写入 {output}")
+            print("   可用 flamegraph.pl 或 https://www.speedscope.app 查看；自身耗时最多的函数:")
+            for name, share in sampler.top_functions(5):
+                print(f"   - {share:6.1%}  {name}")
+            for trace_file in profiler.kept_traces():
+                print(f"   🎬 Playwright追踪: {trace_file}（用 playwright show-trace 查看）")
+        if args.simulate:
+            stats = clock.get_clock().stats()
+            print(f"\n⏱️  虚拟时钟: 共经过 {stats['virtual_elapsed']} 秒，其中等待 {stats['slept']} 秒（{stats['sleep_calls']} 次），"
+                  f"实际工作 {stats['working']} 秒")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,159 @@
+import os
+import json
+import re
+import html
+import logging
+import threading
+import clock
+from pathlib import Path
+import requests
+from comment_history import extract_note_id
+from note_extractor import extract_note, format_note
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# 笔记页面 <head> 中的描述信息，无需登录和渲染即可获取
+META_PATTERNS = [
+    re.compile(r'<meta[^>]+(?:name|property)=["\'](?:og:)?description["\'][^>]+content=["\']([^"\']*)["\']', re.I),
+    re.compile(r'<meta[^>]+content=["\']([^"\']*)["\'][^>]+(?:name|property)=["\'](?:og:)?description["\']', re.I),
+    re.compile(r'<meta[^>]+property=["\']og:title["\'][^>]+content=["\']([^"\']*)["\']', re.I),
+]
+
+
+class NoteContentCache:
+    """笔记内容缓存：按笔记ID缓存正文，带过期时间，供所有账号和评论生成共享
+
+    写入先保存在内存中，累计 save_every 条或距上次保存超过 save_interval_seconds 秒时才写文件，
+    退出前需调用 flush()；写文件时丢弃已过期的条目。
+    """
+
+    def __init__(self, cache_file: str, ttl_seconds: int = 3600, miss_ttl_seconds: int = 300,
+                 save_every: int = 20, save_interval_seconds: int = 60):
+        """初始化缓存并加载未过期的条目，miss_ttl_seconds 为轻量获取失败后不再重试的时间"""
+        self.cache_file = Path(cache_file)
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.miss_ttl_seconds = miss_ttl_seconds
+        self.save_every = save_every
+        self.save_interval_seconds = save_interval_seconds
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        # 上次保存后新写入的条目数
+        self._unsaved = 0
+        self._saved_at = clock.now()
+
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": USER_AGENT})
+
+        self._entries = {}
+        # 笔记ID -> 轻量获取失败的时间（只保存在内存中）
+        self._misses = {}
+        self._load()
+
+    def _load(self):
+        """加载缓存文件"""
+        if not self.cache_file.exists():
+            return
+
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            now = clock.now()
+            self._entries = {
+                note_id: entry for note_id, entry in entries.items()
+                if now - entry.get('fetched_at', 0) < self.ttl_seconds
+            }
+        except Exception as e:
+            self.logger.error(f"加载笔记内容缓存失败: {e}")
+
+    def _save(self):
+        """丢弃过期条目后保存缓存文件（先写临时文件再替换，需持有锁）"""
+        now = clock.now()
+        self._entries = {
+            note_id: entry for note_id, entry in self._entries.items()
+            if now - entry['fetched_at'] < self.ttl_seconds
+        }
+        temp_file = self.cache_file.with_name(f".{self.cache_file.name}.{os.getpid()}.tmp")
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+            self._unsaved = 0
+            self._saved_at = now
+        except Exception as e:
+            self.logger.error(f"保存笔记内容缓存失败: {e}")
+
+    def flush(self):
+        """把尚未保存的条目写入文件"""
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+    def get(self, note_url: str) -> str:
+        """获取缓存的笔记内容，不存在或已过期时返回空字符串"""
+        entry = self._entries.get(extract_note_id(note_url))
+        if not entry:
+            return ""
+        if clock.now() - entry['fetched_at'] >= self.ttl_seconds:
+            return ""
+        return entry['content']
+
+    def put(self, note_url: str, content: str, source: str = ""):
+        """写入笔记内容，source 记录内容来自哪种提取方式"""
+        content = (content or "").strip()
+        if not content:
+            return
+        with self._lock:
+            self._entries[extract_note_id(note_url)] = {
+                'content': content,
+                'source': source,
+                'fetched_at': clock.now(),
+            }
+            self._unsaved += 1
+            if self._unsaved >= self.save_every or clock.now() - self._saved_at >= self.save_interval_seconds:
+                self._save()
+
+    def fetch(self, note_url: str):
+        """不启动浏览器，直接请求页面HTML解析笔记，返回 (内容, 来源)
+
+        优先解析内嵌的初始状态（标题、正文、话题），没有时退回到 <head> 中的描述信息。
+        """
+        try:
+            response = self.session.get(note_url, timeout=10)
+            response.raise_for_status()
+        except Exception as e:
+            self.logger.debug(f"轻量获取笔记内容失败 {note_url}: {e}")
+            return "", ""
+
+        note = extract_note(response.text, extract_note_id(note_url))
+        if note:
+            return format_note(note), 'initial_state'
+
+        for pattern in META_PATTERNS:
+            match = pattern.search(response.text)
+            if match and match.group(1).strip():
+                return html.unescape(match.group(1)).strip(), 'meta'
+        return "", ""
+
+    def get_or_fetch(self, note_url: str) -> str:
+        """优先使用缓存，未命中时轻量获取并写入缓存
+
+        获取失败也会短时间缓存，其他账号处理同一笔记时不再重复请求，直接改用浏览器获取。
+        """
+        content = self.get(note_url)
+        if content:
+            return content
+
+        note_id = extract_note_id(note_url)
+        missed_at = self._misses.get(note_id)
+        if missed_at is not None and clock.now() - missed_at < self.miss_ttl_seconds:
+            return ""
+
+        content, source = self.fetch(note_url)
+        if content:
+            self._misses.pop(note_id, None)
+            self.logger.info(f"已缓存笔记内容: {note_id} (来源: {source})")
+            self.put(note_url, content, source)
+        else:
+            self._misses[note_id] = clock.now()
+        return content
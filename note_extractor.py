@@ -0,0 +1,89 @@
+import re
+import json
+import logging
+
+# 笔记页面HTML中内嵌的初始状态，文档到达即可解析，不需要等待页面渲染
+INITIAL_STATE_PATTERN = re.compile(r'window\.__INITIAL_STATE__\s*=\s*(\{.*?\})\s*;?\s*</script>', re.S)
+# 初始状态不是严格的JSON，其中的 undefined 需要替换为 null
+UNDEFINED_PATTERN = re.compile(r'(?<=[:\[,])\s*undefined\s*(?=[,}\]])')
+
+logger = logging.getLogger(__name__)
+
+
+def parse_initial_state(html_text: str) -> dict:
+    """解析页面内嵌的初始状态，找不到或解析失败时返回None"""
+    match = INITIAL_STATE_PATTERN.search(html_text or "")
+    if not match:
+        return None
+    try:
+        return json.loads(UNDEFINED_PATTERN.sub('null', match.group(1)))
+    except ValueError as e:
+        logger.debug(f"解析页面初始状态失败: {e}")
+        return None
+
+
+def _find_note(state: dict, note_id: str = None) -> dict:
+    """在初始状态中找到笔记对象（兼容新旧两种页面结构）"""
+    note_state = state.get('note') or {}
+
+    detail_map = note_state.get('noteDetailMap') or {}
+    if note_id and isinstance(detail_map.get(note_id), dict):
+        return detail_map[note_id].get('note') or {}
+    for detail in detail_map.values():
+        if isinstance(detail, dict) and detail.get('note'):
+            return detail['note']
+
+    return note_state.get('note') or {}
+
+
+def extract_note(html_text: str, note_id: str = None) -> dict:
+    """从HTML中提取笔记 {'title', 'body', 'tags', 'author'}，没有内嵌状态或没有正文时返回None"""
+    state = parse_initial_state(html_text)
+    if not state:
+        return None
+
+    note = _find_note(state, note_id)
+    title = (note.get('title') or '').strip()
+    body = (note.get('desc') or '').strip()
+    if not title and not body:
+        return None
+
+    return {
+        'title': title,
+        'body': body,
+        'tags': [tag['name'] for tag in note.get('tagList') or [] if isinstance(tag, dict) and tag.get('name')],
+        'author': ((note.get('user') or {}).get('nickname') or '').strip(),
+    }
+
+
+def format_note(note: dict) -> str:
+    """把提取的笔记整理成用于生成评论的文本"""
+    parts = [note['title'], note['body']]
+    if note['tags']:
+        parts.append(' '.join(f"#{tag}" for tag in note['tags']))
+    return '\n'.join(part for part in parts if part)
+
+
+def extract_from_page(page, selectors, note_id: str = None, dom_timeout: int = 10000):
+    """从已打开的笔记页面提取内容，返回 (内容, 来源)
+
+    优先解析文档中的内嵌初始状态（来源 initial_state），失败时退回到 DOM 选择器并最多等待 dom_timeout 毫秒（来源 dom），
+    都失败时返回 ("", "")。
+    """
+    try:
+        note = extract_note(page.content(), note_id)
+        if note:
+            return format_note(note), 'initial_state'
+    except Exception as e:
+        logger.debug(f"读取页面初始状态失败: {e}")
+
+    try:
+        content_element = selectors.find(page, 'note_content', timeout=dom_timeout)
+        if content_element is not None:
+            content = (content_element.text_content() or '').strip()
+            if content:
+                return content, 'dom'
+    except Exception as e:
+        logger.debug(f"从页面元素获取笔记内容失败: {e}")
+
+    return "", ""
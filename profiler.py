@@ -0,0 +1,146 @@
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """采样分析器：后台线程定期抓取所有线程的调用栈，输出 flamegraph.pl / speedscope 可直接读取的折叠栈格式"""
+
+    def __init__(self, interval_ms: float = 5):
+        """初始化，interval_ms 为采样间隔"""
+        self.interval = interval_ms / 1000
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.samples[';'.join(reversed(stack))] += 1
+        self.sample_count += 1
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        """开始采样"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def write(self, output_file: str) -> Path:
+        """写出折叠栈文件（每行: 线程;外层函数;...;内层函数 采样次数）"""
+        output_file = Path(output_file)
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return output_file
+
+    def top_functions(self, limit: int = 10) -> list:
+        """按自身耗时（位于栈顶的采样数）排序的函数 [(函数, 占比)]"""
+        leaf = Counter()
+        for stack, count in self.samples.items():
+            leaf[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaf.values()) or 1
+        return [(name, count / total) for name, count in leaf.most_common(limit)]
+
+
+class TraceRecorder:
+    """Playwright 追踪：每个操作都录制，只保留失败或耗时超过阈值的操作的追踪文件"""
+
+    def __init__(self, trace_dir: str, threshold_seconds: float = 90):
+        """初始化"""
+        self.trace_dir = Path(trace_dir)
+        self.threshold = threshold_seconds
+        self.kept = []
+
+
+class OperationTrace:
+    """一次操作的追踪状态，调用方把操作结果写入 success"""
+
+    def __init__(self):
+        self.success = None
+
+
+_recorder = None
+
+
+def enable_tracing(trace_dir: str, threshold_seconds: float = 90) -> TraceRecorder:
+    """开启所有模块的 Playwright 追踪"""
+    global _recorder
+    _recorder = TraceRecorder(trace_dir, threshold_seconds)
+    return _recorder
+
+
+def kept_traces() -> list:
+    """本次运行保留下来的追踪文件"""
+    return _recorder.kept if _recorder else []
+
+
+@contextmanager
+def trace_operation(context, name: str):
+    """录制一次操作；操作抛出异常、结果为失败或耗时超过阈值时保存追踪文件，否则丢弃。未开启追踪时不做任何事"""
+    trace = OperationTrace()
+    recorder = _recorder
+    if recorder is None:
+        yield trace
+        return
+
+    try:
+        context.tracing.start(screenshots=True, snapshots=True)
+    except Exception as e:
+        logger.debug(f"开启Playwright追踪失败: {e}")
+        yield trace
+        return
+
+    started = time.time()
+    failed = True
+    try:
+        yield trace
+        failed = trace.success is False
+    finally:
+        elapsed = time.time() - started
+        try:
+            if failed or elapsed > recorder.threshold:
+                recorder.trace_dir.mkdir(parents=True, exist_ok=True)
+                safe_name = re.sub(r'[\\/:*?"<>|\s]', '_', name)
+                path = recorder.trace_dir / f"{safe_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+                context.tracing.stop(path=str(path))
+                recorder.kept.append(path)
+                reason = "失败" if failed else f"耗时 {elapsed:.0f} 秒"
+                logger.info(f"已保存Playwright追踪（{reason}）: {path}")
+            else:
+                context.tracing.stop()
+        except Exception as e:
+            logger.debug(f"停止Playwright追踪失败: {e}")
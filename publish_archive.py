@@ -0,0 +1,131 @@
+import io
+import gzip
+import hashlib
+import sqlite3
+import tarfile
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+import clock
+
+
+class PublishArchive:
+    """已发布文案归档：每篇文案及其图片打包压缩后追加到当天的归档包，索引记录 文案哈希 -> (归档包, 偏移, 长度, 账号, 发布时间)
+
+    每个发布单元是归档包中一段独立的 gzip 数据，按索引中的偏移直接读取解压，不需要扫描整个归档包。
+    """
+
+    def __init__(self, archive_dir: str):
+        """初始化归档目录和索引"""
+        self.archive_dir = Path(archive_dir)
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.archive_dir / "index.db"
+        self.logger = logging.getLogger(__name__)
+        self._local = threading.local()
+
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS archive (
+                draft_hash TEXT PRIMARY KEY,
+                draft_name TEXT NOT NULL,
+                bundle TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                account TEXT NOT NULL,
+                published_at REAL NOT NULL
+            );
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def draft_hash(content: str) -> str:
+        """文案内容哈希"""
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _pack(files: list) -> bytes:
+        """把文件打包并压缩成一段独立的 gzip 数据"""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as tar:
+            for path in files:
+                tar.add(path, arcname=Path(path).name)
+        return gzip.compress(buffer.getvalue())
+
+    def archive(self, draft_file: Path, assets: list, account_name: str) -> dict:
+        """归档一篇已发布的文案和图片并删除原文件，返回索引记录"""
+        content = draft_file.read_text(encoding='utf-8').strip()
+        draft_hash = self.draft_hash(content)
+        data = self._pack([draft_file] + [asset for asset in assets if asset.exists()])
+        published_at = clock.now()
+        bundle = self.archive_dir / f"{datetime.fromtimestamp(published_at).strftime('%Y%m%d')}.bundle"
+
+        # 用索引库的写锁串行化多个进程对同一归档包的追加
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            offset = bundle.stat().st_size if bundle.exists() else 0
+            with open(bundle, 'ab') as f:
+                f.write(data)
+                f.flush()
+            conn.execute(
+                "INSERT OR REPLACE INTO archive VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (draft_hash, draft_file.name, bundle.name, offset, len(data), account_name, published_at)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        # 归档成功后才删除原文件
+        for path in [draft_file] + list(assets):
+            path.unlink(missing_ok=True)
+
+        self.logger.info(f"已归档 {draft_file.name} 到 {bundle.name}（{len(data)} 字节）")
+        return self.lookup(draft_hash)
+
+    def lookup(self, draft_hash: str) -> dict:
+        """按文案哈希查找归档记录，不存在时返回None"""
+        row = self._conn().execute("SELECT * FROM archive WHERE draft_hash = ?", (draft_hash,)).fetchone()
+        return dict(row) if row else None
+
+    def is_archived(self, content: str) -> bool:
+        """相同内容的文案是否已经发布归档过"""
+        return self.lookup(self.draft_hash(content)) is not None
+
+    def extract(self, draft_hash: str, target_dir: str) -> list:
+        """把归档的文案和图片解压到目录，返回解压出的文件路径"""
+        entry = self.lookup(draft_hash)
+        if entry is None:
+            raise KeyError(f"没有找到归档: {draft_hash}")
+
+        with open(self.archive_dir / entry['bundle'], 'rb') as f:
+            f.seek(entry['offset'])
+            data = gzip.decompress(f.read(entry['length']))
+
+        target_dir = Path(target_dir)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        extracted = []
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r') as tar:
+            for member in tar.getmembers():
+                # 归档时只保存了文件名，忽略其他条目
+                if not member.isfile() or Path(member.name).name != member.name:
+                    continue
+                path = target_dir / member.name
+                path.write_bytes(tar.extractfile(member).read())
+                extracted.append(path)
+        return extracted
+
+    def stats(self) -> dict:
+        """归档统计"""
+        row = self._conn().execute(
+            "SELECT COUNT(*) AS drafts, COUNT(DISTINCT bundle) AS bundles, COALESCE(SUM(length), 0) AS bytes FROM archive"
+        ).fetchone()
+        return dict(row)
@@ -0,0 +1,74 @@
+import queue
+import logging
+import threading
+
+# 生产者结束标记
+_END = object()
+
+
+class PublishPipeline:
+    """发布流水线：生产者线程提前读取、校验文案并预处理图片，准备好的发布单元放入有界队列；
+    消费者（浏览器所在线程）只负责页面操作，磁盘和CPU工作与网络等待重叠进行。
+
+    无效的文案同样会产出（带 error 字段），由消费者直接记为失败，不占用浏览器会话。
+    """
+
+    def __init__(self, publisher, draft_files: list, depth: int = 2):
+        """初始化流水线，depth 为提前准备好的发布单元数量上限"""
+        self.publisher = publisher
+        self.draft_files = list(draft_files)
+        self.logger = logging.getLogger(__name__)
+
+        self._queue = queue.Queue(maxsize=max(1, depth))
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _put(self, item) -> bool:
+        """放入队列，队列已满时等待，流水线停止时放弃"""
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        """生产者：依次准备文案"""
+        try:
+            for draft_file in self.draft_files:
+                if self._stop_event.is_set():
+                    return
+                try:
+                    unit = self.publisher.prepare_draft(draft_file)
+                except Exception as e:
+                    self.logger.error(f"准备文案失败 {draft_file}: {e}")
+                    unit = {'draft_file': draft_file, 'content': "", 'assets': [], 'error': type(e).__name__}
+                if not self._put(unit):
+                    return
+        finally:
+            self._put(_END)
+
+    def start(self):
+        """启动生产者线程"""
+        self._thread = threading.Thread(target=self._produce, name="publish-prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止生产者（消费者提前结束时调用）"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __iter__(self):
+        """按文案顺序产出准备好的发布单元"""
+        if self._thread is None:
+            self.start()
+        try:
+            while True:
+                unit = self._queue.get()
+                if unit is _END:
+                    return
+                yield unit
+        finally:
+            self.stop()
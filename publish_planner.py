@@ -0,0 +1,52 @@
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def account_publish_settings(config: dict, account_names: list) -> list:
+    """读取账号的发布参数：容量、发帖间隔、优先级（账号未单独配置时使用 publishing 中的全局值）"""
+    publishing = config['publishing']
+    accounts_by_name = {account['name']: account for account in config['accounts']}
+    settings = []
+    for order, name in enumerate(account_names):
+        account = accounts_by_name.get(name, {})
+        settings.append({
+            'name': name,
+            'capacity': account.get('max_posts_per_day', publishing['max_posts_per_day']),
+            'interval_seconds': account.get('min_interval_hours', publishing['min_interval_hours']) * 3600,
+            'priority': account.get('priority', 0),
+            'order': order,
+        })
+    return settings
+
+
+def plan_publishing(draft_files: list, accounts: list, max_posts: int = None, window_seconds: float = None) -> list:
+    """一次性为所有文案分配账号和发布时间，返回按发布时间排序的计划 [{'draft_file', 'account', 'offset_seconds'}]
+
+    每篇文案只分配给一个账号。依次为每篇文案选择最早有空档的账号，同一时间有空档时优先级高的账号优先，
+    再按已分配数量轮流，使所有账号的发帖间隔重叠利用。账号容量用完、下一个空档超出时间窗口或达到总数上限后停止分配。
+    """
+    heap = [(0.0, -account['priority'], 0, account['order'], account) for account in accounts if account['capacity'] > 0]
+    heapq.heapify(heap)
+
+    plan = []
+    for draft_file in draft_files:
+        if max_posts is not None and len(plan) >= max_posts:
+            break
+        if not heap:
+            break
+        slot, neg_priority, assigned, order, account = heapq.heappop(heap)
+        if window_seconds is not None and slot > window_seconds:
+            # 最早的空档都已超出时间窗口，其余账号也不会更早
+            break
+
+        plan.append({'draft_file': draft_file, 'account': account['name'], 'offset_seconds': slot})
+        if assigned + 1 < account['capacity']:
+            heapq.heappush(heap, (slot + account['interval_seconds'], neg_priority, assigned + 1, order, account))
+
+    plan.sort(key=lambda entry: entry['offset_seconds'])
+    unplanned = len(draft_files) - len(plan)
+    if unplanned:
+        logger.info(f"{unplanned} 篇文案超出本次账号容量或时间窗口，留待下次发布")
+    return plan
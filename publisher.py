@@ -1,20 +1,37 @@
-import json
-import os
 import time
 import random
 from pathlib import Path
-from playwright.sync_api import sync_playwright, Page
+from playwright.sync_api import Page, Locator
 import yaml
 import logging
-from datetime import datetime, timedelta
+import clock
+from PIL import Image
 from login_manager import LoginManager
+from browser_pool import open_account_page
+from run_report import make_result
+from step_runner import StepRunner, StepFailed
+from profiler import trace_operation
+from publish_pipeline import PublishPipeline
+from upload_tracker import UploadTracker
+from publish_planner import plan_publishing, account_publish_settings
+from publish_archive import PublishArchive
+import circuit_breaker
+from circuit_breaker import CircuitBreaker
 
 class Publisher:
-    def __init__(self, config_path: str = "config.yaml"):
+    def __init__(self, config_path: str = "config.yaml", login_manager: LoginManager = None):
         """初始化发帖管理器"""
         self.config = self._load_config(config_path)
         self.setup_logging()
-        self.login_manager = LoginManager(config_path)
+        self.login_manager = login_manager or LoginManager(config_path)
+        self.selectors = self.login_manager.selectors
+        self.timeouts = self.login_manager.timeouts
+        # 常驻浏览器池（守护进程模式下设置）
+        self.browser_pool = None
+        self.last_error = None
+        self.upload_metrics = []
+        # 创作平台地址（可指向本地模拟站点）
+        self.creator_url = self.config.get('sites', {}).get('creator', "https://creator.xiaohongshu.com").rstrip('/')
         
         # 创建必要的目录
         self.drafts_dir = Path(self.config['paths']['drafts'])
@@ -22,6 +39,12 @@ class Publisher:
         self.drafts_dir.mkdir(exist_ok=True)
         self.assets_dir.mkdir(exist_ok=True)
         
+        # 已发布文案的压缩归档
+        self.archive = PublishArchive(self.config['paths'].get('archive', self.drafts_dir / "published"))
+        
+        # 预处理后的图片（缩小、转换格式）暂存目录
+        self.staging_dir = Path(self.config['paths'].get('data', 'data/')) / "staging"
+        
     def _load_config(self, config_path: str) -> dict:
         """加载配置文件"""
         with open(config_path, 'r', encoding='utf-8') as f:
@@ -45,16 +68,16 @@ class Publisher:
     def random_delay(self, min_delay: int = 1000, max_delay: int = 3000):
         """随机延迟，模拟人工操作"""
         delay = random.randint(min_delay, max_delay)
-        time.sleep(delay / 1000)
+        clock.sleep(delay / 1000)
     
-    def human_like_typing(self, page: Page, selector: str, text: str):
-        """模拟人工输入文字"""
-        page.click(selector)
-        page.fill(selector, "")  # 清空输入框
+    def human_like_typing(self, element: Locator, text: str):
+        """模拟人工输入文字（element 为已定位到的输入框）"""
+        element.click()
+        element.fill("")  # 清空输入框
         
         for char in text:
-            page.type(selector, char)
-            time.sleep(random.randint(50, 150) / 1000)  # 随机输入间隔
+            element.type(char)
+            clock.sleep(random.randint(50, 150) / 1000)  # 随机输入间隔
     
     def get_draft_files(self) -> list:
         """获取所有文案文件"""
@@ -72,9 +95,10 @@ class Publisher:
         for ext in ['*.jpg', '*.jpeg', '*.png', '*.gif']:
             for file in self.assets_dir.glob(f"{base_name}_{ext}"):
                 assets.append(file)
-            # 也查找不带后缀的文件
+            # 也查找不带后缀的文件（两种模式可能匹配到同一个文件）
             for file in self.assets_dir.glob(f"{base_name}{ext}"):
-                assets.append(file)
+                if file not in assets:
+                    assets.append(file)
         
         return assets
     
@@ -87,187 +111,340 @@ class Publisher:
             self.logger.error(f"读取文案文件失败 {draft_file}: {e}")
             return ""
     
-    def publish_note(self, account_name: str, draft_file: Path) -> bool:
-        """发布单篇笔记"""
-        self.logger.info(f"开始发布笔记: {draft_file.name} (账号: {account_name})")
+    def _prepare_asset(self, asset: Path) -> Path:
+        """校验图片，超过尺寸上限或实际格式与扩展名不符时生成预处理后的副本"""
+        with Image.open(asset) as image:
+            image.verify()
+        
+        max_side = self.config['publishing'].get('max_image_side', 4096)
+        with Image.open(asset) as image:
+            expected = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF'}.get(asset.suffix.lower())
+            oversized = max_side and max(image.size) > max_side and image.format != 'GIF'
+            if image.format == expected and not oversized:
+                return asset
+            
+            self.staging_dir.mkdir(parents=True, exist_ok=True)
+            if image.format == 'PNG':
+                staged = self.staging_dir / f"{asset.stem}.png"
+            else:
+                staged = self.staging_dir / f"{asset.stem}.jpg"
+                image = image.convert('RGB')
+            if oversized:
+                image.thumbnail((max_side, max_side))
+            image.save(staged)
+            self.logger.info(f"图片已预处理: {asset.name} -> {staged}")
+            return staged
+    
+    def prepare_draft(self, draft_file: Path) -> dict:
+        """读取并校验文案、预处理图片，返回发布单元 {'draft_file', 'content', 'assets', 'error'}
+
+        文案为空或图片损坏时 error 不为空，这样的文案不需要打开浏览器。
+        """
+        unit = {'draft_file': draft_file, 'content': "", 'assets': [], 'error': None}
         
         # 读取文案内容
-        content = self.read_draft_content(draft_file)
-        if not content:
+        unit['content'] = self.read_draft_content(draft_file)
+        if not unit['content']:
             self.logger.error(f"文案内容为空: {draft_file}")
-            return False
+            unit['error'] = "EmptyDraft"
+            return unit
+        
+        # 相同内容的文案已经发布归档过
+        if self.archive.is_archived(unit['content']):
+            self.logger.error(f"相同内容的文案已经发布过: {draft_file}")
+            unit['error'] = "AlreadyPublished"
+            return unit
         
-        # 获取对应的图片文件
-        assets = self.get_assets_for_draft(draft_file)
+        # 获取并预处理对应的图片文件
+        for asset in self.get_assets_for_draft(draft_file):
+            try:
+                unit['assets'].append(self._prepare_asset(asset))
+            except Exception as e:
+                self.logger.error(f"图片无法使用: {draft_file} ({asset}: {e})")
+                unit['error'] = "InvalidAsset"
+                return unit
+        
+        return unit
+    
+    def publish_note(self, account_name: str, draft_file: Path, unit: dict = None) -> bool:
+        """发布单篇笔记，unit 为已经准备好的发布单元（未提供时现场准备）"""
+        self.logger.info(f"开始发布笔记: {draft_file.name} (账号: {account_name})")
+        self.last_error = None
+        # 本次发布中每个图片文件的上传指标
+        self.upload_metrics = []
         
-        # 加载账号Cookie
-        cookies = self.login_manager.load_cookies(account_name)
-        if not cookies:
-            self.logger.error(f"账号 {account_name} 的Cookie不存在，请先登录")
+        if unit is None:
+            unit = self.prepare_draft(draft_file)
+        if unit['error']:
+            self.logger.error(f"文案无法发布 ({unit['error']}): {draft_file.name}")
+            self.last_error = unit['error']
             return False
+        content = unit['content']
+        assets = unit['assets']
         
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=self.config['browser']['headless'],
-                slow_mo=self.config['browser']['slow_mo']
-            )
+        try:
+            # 账号或创作平台已熔断时直接失败，不再启动浏览器等待超时
+            account_breaker, site_breaker = self._circuit_breakers(account_name)
+            blocked = circuit_breaker.acquire([account_breaker, site_breaker])
+            if blocked:
+                self.logger.warning(f"{blocked.name} 已熔断，跳过发布: {draft_file.name}")
+                self.last_error = f"CircuitOpen:{blocked.name}"
+                return False
             
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-            )
+            # 加载账号Cookie
+            cookies = self.login_manager.load_cookies(account_name)
+            if not cookies:
+                self.logger.error(f"账号 {account_name} 的Cookie不存在，请先登录，无法发布: {draft_file.name}")
+                account_breaker.record_failure()
+                site_breaker.release()
+                return False
             
-            # 添加Cookie
-            context.add_cookies(cookies)
+            success = False
+            try:
+                success = self._publish_in_browser(account_name, draft_file, content, assets, cookies)
+                return success
+            finally:
+                circuit_breaker.record_outcome(account_breaker, site_breaker, success, self.last_error)
+        finally:
+            # 清理本次预处理生成的图片副本
+            for asset in assets:
+                if asset.parent == self.staging_dir:
+                    asset.unlink(missing_ok=True)
+    
+    def _circuit_breakers(self, account_name: str) -> tuple:
+        """账号和创作平台的熔断器"""
+        settings = self.config.get('circuit_breaker', {})
+        return CircuitBreaker.for_account(account_name, settings), CircuitBreaker.for_site(self.creator_url, settings)
+    
+    def _publish_in_browser(self, account_name: str, draft_file: Path, content: str, assets: list,
+                            cookies: list) -> bool:
+        """在浏览器中完成发布的各个步骤"""
+        # 有常驻浏览器池时复用账号上下文，否则临时启动浏览器
+        with self.login_manager.account_session(account_name), \
+                open_account_page(self.config, account_name, cookies, self.browser_pool) as (context, page), \
+                trace_operation(context, f"publish_{account_name}_{draft_file.stem}") as trace:
+            trace.success = self._run_publish_steps(account_name, draft_file, content, assets, context, page)
+            return trace.success
+    
+    def _run_publish_steps(self, account_name: str, draft_file: Path, content: str, assets: list,
+                           context, page: Page) -> bool:
+        """依次执行发布步骤"""
+        steps = StepRunner(f"发布 {draft_file.name}", self.config.get('step_retries', {}))
+        try:
+            # 访问小红书创作页面
+            if not steps.run('navigate', self._open_creator_page, page):
+                self.logger.error(f"账号 {account_name} 登录状态已失效，无法发布: {draft_file.name}")
+                self.last_error = "LoginExpired"
+                return False
+            
+            # 输入文案内容
+            steps.run('fill', self._fill_content, page, content)
+            
+            # 上传图片
+            if assets:
+                steps.run('upload', self._upload_assets, page, assets)
+            
+            # 添加话题标签（可选）
+            if "#" in content:
+                self.logger.info("检测到话题标签，等待话题自动识别")
+                self.random_delay(2000, 4000)
+            
+            # 点击发布按钮
+            steps.run('submit', self._click_publish, page)
             
-            page = context.new_page()
-            page.set_default_timeout(self.config['browser']['timeout'])
+            # 写回服务器更新过的Cookie
+            self.login_manager.sync_cookies(account_name, context)
             
+            # 等待发布完成
             try:
-                # 访问小红书创作页面
-                page.goto("https://creator.xiaohongshu.com/publish/publish")
-                self.random_delay(3000, 5000)
+                steps.run('confirm', self._wait_publish_confirm, page)
+                self.logger.info(f"笔记发布成功: {draft_file.name}")
                 
-                # 等待页面加载
-                page.wait_for_load_state("networkidle")
+                # 归档已发布的文件
+                self._archive_published_file(account_name, draft_file)
+            except StepFailed:
+                self.logger.warning(f"发布状态检查超时，可能已发布成功: {draft_file.name}")
+            return True
                 
-                # 检查是否已登录
-                try:
-                    # 查找登录提示或重定向到登录页面
-                    if "login" in page.url.lower():
-                        self.logger.error(f"账号 {account_name} 登录状态已失效")
-                        return False
-                except:
-                    pass
-                
-                # 等待创作页面加载完成
-                page.wait_for_selector('div[contenteditable="true"], textarea, .editor', timeout=10000)
-                self.random_delay()
-                
-                # 输入文案内容
-                editor = page.locator('div[contenteditable="true"], textarea, .editor').first
-                if editor.is_visible():
-                    self.human_like_typing(page, editor, content)
-                    self.random_delay()
-                
-                # 上传图片
-                if assets:
-                    self.logger.info(f"准备上传 {len(assets)} 张图片")
-                    
-                    # 查找上传按钮
-                    upload_btn = page.locator('input[type="file"], .upload-btn, [data-testid="upload"]').first
-                    if upload_btn.is_visible():
-                        # 上传所有图片
-                        file_paths = [str(asset) for asset in assets]
-                        upload_btn.set_input_files(file_paths)
-                        
-                        self.logger.info(f"开始上传图片: {file_paths}")
-                        self.random_delay(3000, 5000)
-                        
-                        # 等待图片上传完成
-                        try:
-                            page.wait_for_selector('.upload-success, .uploaded', timeout=30000)
-                            self.logger.info("图片上传完成")
-                        except:
-                            self.logger.warning("图片上传状态检查超时，继续执行")
-                
-                # 添加话题标签（可选）
-                if "#" in content:
-                    self.logger.info("检测到话题标签，等待话题自动识别")
-                    self.random_delay(2000, 4000)
-                
-                # 点击发布按钮
-                publish_btn = page.locator('button:has-text("发布"), button:has-text("发 布"), .publish-btn').first
-                if publish_btn.is_visible():
-                    self.logger.info("点击发布按钮")
-                    publish_btn.click()
-                    self.random_delay(3000, 5000)
-                    
-                    # 等待发布完成
-                    try:
-                        page.wait_for_selector('.publish-success, .success-message', timeout=30000)
-                        self.logger.info(f"笔记发布成功: {draft_file.name}")
-                        
-                        # 移动已发布的文件到已发布目录
-                        self._move_published_file(draft_file)
-                        
-                        return True
-                    except:
-                        self.logger.warning("发布状态检查超时，可能已发布成功")
-                        return True
-                else:
-                    self.logger.error("未找到发布按钮")
-                    return False
-                    
-            except Exception as e:
-                self.logger.error(f"发布笔记时出现错误: {e}")
-                return False
-            finally:
-                browser.close()
+        except StepFailed as e:
+            self.logger.error(f"发布笔记 {draft_file.name} 时出现错误: {e}（已完成步骤: {steps.describe()}）")
+            self.last_error = f"{e.step}:{type(e.cause).__name__}"
+            return False
+        except Exception as e:
+            self.logger.error(f"发布笔记 {draft_file.name} 时出现错误: {e}")
+            self.last_error = type(e).__name__
+            return False
+    
+    def _open_creator_page(self, page: Page) -> bool:
+        """打开创作页面，账号登录状态失效时返回False"""
+        with self.timeouts.step('creator_page_load', self.config['browser']['timeout']) as timeout:
+            page.goto(f"{self.creator_url}/publish/publish", timeout=timeout)
+        self.random_delay(3000, 5000)
+        
+        # 等待页面加载
+        page.wait_for_load_state("networkidle")
+        
+        # 查找登录提示或重定向到登录页面
+        return "login" not in page.url.lower()
     
-    def _move_published_file(self, draft_file: Path):
-        """移动已发布的文件到已发布目录"""
+    def _fill_content(self, page: Page, content: str):
+        """等待编辑器并输入文案（重试时会先清空再重新输入）"""
+        with self.timeouts.step('editor', 10000) as timeout:
+            editor = self.selectors.find(page, 'editor', timeout=timeout)
+            if editor is None:
+                # 已等待满本步骤的超时时间，计为超时
+                self.timeouts.record_timeout('editor')
+                raise TimeoutError("未找到文案编辑器")
+        self.random_delay()
+        
+        self.human_like_typing(editor, content)
+        self.random_delay()
+    
+    def _upload_assets(self, page: Page, assets: list):
+        """上传图片，通过网络请求跟踪每个文件的上传，全部文件上传成功即完成
+
+        重试时只重新上传还没有成功的文件。
+        """
+        uploaded = {m['file'] for m in self.upload_metrics if m['status'] == 'ok'}
+        pending = [asset for asset in assets if Path(asset).name not in uploaded]
+        self.logger.info(f"准备上传 {len(pending)} 张图片")
+        
+        # 查找上传按钮
+        upload_btn = self.selectors.find(page, 'upload_input', state='attached')
+        if upload_btn is None:
+            raise TimeoutError("未找到图片上传控件")
+        
+        tracker = UploadTracker(page, pending, self.config['publishing'].get('upload_url_patterns'))
+        tracker.start()
         try:
-            published_dir = self.drafts_dir / "published"
-            published_dir.mkdir(exist_ok=True)
+            # 上传所有图片
+            file_paths = [str(asset) for asset in pending]
+            upload_btn.set_input_files(file_paths)
+            self.logger.info(f"开始上传图片: {file_paths}")
             
-            # 移动文案文件
-            new_path = published_dir / f"{draft_file.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-            draft_file.rename(new_path)
-            
-            # 移动对应的图片文件
+            # 等待图片上传完成；只有全部上传成功时才记录耗时样本，
+            # 没有识别到上传请求或服务端返回错误时的等待时间不代表上传耗时，都不计入
+            timeout = self.timeouts.timeout_for('upload_confirm', 30000)
+            wait_started = time.time()
+            done = tracker.wait(timeout)
+            if done:
+                self.timeouts.record('upload_confirm', (time.time() - wait_started) * 1000)
+            elif tracker.failures:
+                raise RuntimeError(f"图片上传失败: {tracker.completed()}/{len(pending)}")
+            elif tracker.requests_seen:
+                self.timeouts.record_timeout('upload_confirm')
+                raise TimeoutError(f"图片上传未完成: {tracker.completed()}/{len(pending)}")
+        finally:
+            tracker.stop()
+            self._record_upload_metrics(tracker.metrics())
+        
+        if done:
+            self.logger.info("图片上传完成")
+            return
+        
+        # 没有识别到上传请求（上传地址规则可能需要更新），退回到页面提示确认
+        self.logger.warning("未识别到图片上传请求，改用页面提示确认上传状态")
+        try:
+            page.wait_for_selector('.upload-success, .uploaded', timeout=self.timeouts.timeout_for('upload_confirm', 30000))
+            self.logger.info("图片上传完成")
+        except:
+            self.logger.warning("图片上传状态检查超时，继续执行")
+    
+    def _record_upload_metrics(self, metrics: list):
+        """记录每个文件的上传指标（重试时覆盖同一文件之前的记录）"""
+        for metric in metrics:
+            if metric['status'] is None:
+                continue
+            metric['status'] = 'ok' if isinstance(metric['status'], int) and metric['status'] < 400 else 'failed'
+            self.upload_metrics = [m for m in self.upload_metrics if m['file'] != metric['file']] + [metric]
+            self.logger.info(f"图片上传 {metric['file']}: {metric['bytes']} 字节, {metric['duration']} 秒, "
+                             f"{metric['throughput_kbps']} KB/s ({metric['status']})")
+    
+    def _click_publish(self, page: Page):
+        """点击发布按钮（找不到按钮时还没有提交，可以安全重试）"""
+        publish_btn = self.selectors.find(page, 'publish_button')
+        if publish_btn is None:
+            raise TimeoutError("未找到发布按钮")
+        self.logger.info("点击发布按钮")
+        publish_btn.click()
+        self.random_delay(3000, 5000)
+    
+    def _wait_publish_confirm(self, page: Page):
+        """等待发布成功提示"""
+        with self.timeouts.step('publish_confirm', 30000) as timeout:
+            page.wait_for_selector('.publish-success, .success-message', timeout=timeout)
+    
+    def _archive_published_file(self, account_name: str, draft_file: Path):
+        """把已发布的文案和图片压缩归档，并从文案、图片目录中移除"""
+        try:
+            # 在移除文案之前确定对应的图片
             assets = self.get_assets_for_draft(draft_file)
-            for asset in assets:
-                if asset.exists():
-                    asset_new_path = published_dir / f"{asset.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{asset.suffix}"
-                    asset.rename(asset_new_path)
-            
-            self.logger.info(f"已移动已发布文件到: {published_dir}")
+            self.archive.archive(draft_file, assets, account_name)
         except Exception as e:
-            self.logger.error(f"移动已发布文件失败: {e}")
+            self.logger.error(f"归档已发布文件失败: {e}")
     
     def publish_all_drafts(self, max_posts: int = None) -> dict:
         """发布所有文案"""
+        results = {}
+        for record in self.iter_publish_drafts(max_posts):
+            results[f"{record['account']}_{record['target']}"] = record['status'] == 'success'
+        return results
+    
+    def plan_drafts(self, max_posts: int = None) -> list:
+        """验证账号登录状态，并一次性为所有文案分配账号和发布时间"""
         if max_posts is None:
             max_posts = self.config['publishing']['max_posts_per_day']
         
-        draft_files = self.get_draft_files()
+        draft_files = sorted(self.get_draft_files())
         if not draft_files:
             self.logger.warning("没有找到可发布的文案文件")
-            return {}
+            return []
         
-        results = {}
-        posts_count = 0
+        # 验证登录状态（并行探测）
+        valid_accounts = []
+        for account_name, valid in self.login_manager.verify_all_accounts().items():
+            if valid:
+                valid_accounts.append(account_name)
+            else:
+                self.logger.warning(f"账号 {account_name} 登录状态无效，跳过")
         
-        for account in self.config['accounts']:
-            if posts_count >= max_posts:
-                break
-                
-            account_name = account['name']
+        window_hours = self.config['publishing'].get('window_hours', 24)
+        plan = plan_publishing(
+            draft_files,
+            account_publish_settings(self.config, valid_accounts),
+            max_posts,
+            window_hours * 3600 if window_hours else None
+        )
+        for entry in plan:
+            self.logger.info(f"发布计划: +{entry['offset_seconds'] / 3600:.1f}小时 {entry['account']} -> {entry['draft_file'].name}")
+        return plan
+    
+    def iter_publish_drafts(self, max_posts: int = None):
+        """按发布计划逐条产出发布结果记录，每篇笔记处理完立即返回，不在内存中累积"""
+        plan = self.plan_drafts(max_posts)
+        if not plan:
+            return
+        
+        # 后台线程按计划顺序提前准备文案，浏览器只做页面操作
+        pipeline = PublishPipeline(self, [entry['draft_file'] for entry in plan],
+                                   self.config['publishing'].get('prefetch_depth', 2))
+        run_started = clock.now()
+        for entry, unit in zip(plan, pipeline):
+            account_name = entry['account']
+            draft_file = unit['draft_file']
             
-            # 验证登录状态
-            if not self.login_manager.verify_login_status(account_name):
-                self.logger.warning(f"账号 {account_name} 登录状态无效，跳过")
-                continue
+            # 等到该账号的计划发布时间（账号之间的发帖间隔相互重叠）
+            wait_seconds = run_started + entry['offset_seconds'] - clock.now()
+            if wait_seconds > 0 and not unit['error']:
+                self.logger.info(f"等待 {wait_seconds / 3600:.1f} 小时后由账号 {account_name} 发布 {draft_file.name}...")
+                clock.sleep(wait_seconds)
             
-            # 为每个账号发布文案
-            for draft_file in draft_files:
-                if posts_count >= max_posts:
-                    break
-                
-                success = self.publish_note(account_name, draft_file)
-                results[f"{account_name}_{draft_file.name}"] = success
-                
-                if success:
-                    posts_count += 1
-                
-                # 发帖间隔
-                if len(draft_files) > 1:
-                    interval_hours = self.config['publishing']['min_interval_hours']
-                    if interval_hours:
-                        self.logger.info(f"等待 {interval_hours} 小时后继续发布...")
-                        time.sleep(interval_hours * 3600)
-        
-        return results
+            started_at = clock.now()
+            success = self.publish_note(account_name, draft_file, unit)
+            record = make_result('publish', account_name, draft_file.name, success, started_at, self.last_error)
+            if self.upload_metrics:
+                record['uploads'] = self.upload_metrics
+            yield record
     
     def create_sample_draft(self):
         """创建示例文案文件"""
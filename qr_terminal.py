@@ -0,0 +1,69 @@
+from PIL import Image, ImageOps
+
+# 二维码四周保留的空白模块数，便于手机识别
+QUIET_ZONE = 2
+
+
+def _read_modules(image_path: str) -> list:
+    """把二维码截图还原成模块矩阵（True 表示黑色模块）"""
+    image = Image.open(image_path).convert('L')
+    bw = image.point(lambda value: 0 if value < 128 else 255)
+
+    # 裁剪到黑色区域的边界
+    bbox = ImageOps.invert(bw).getbbox()
+    if not bbox:
+        return []
+    bw = bw.crop(bbox)
+    width, height = bw.size
+    pixels = bw.load()
+
+    # 左上角定位图案宽度为 7 个模块，据此推算模块大小
+    run = 0
+    while run < width and pixels[run, 0] == 0:
+        run += 1
+    module_size = run / 7
+    if module_size < 1:
+        return []
+
+    count = round(width / module_size)
+    rows = round(height / module_size)
+    modules = []
+    for y in range(rows):
+        row = []
+        for x in range(count):
+            px = min(int((x + 0.5) * module_size), width - 1)
+            py = min(int((y + 0.5) * module_size), height - 1)
+            row.append(pixels[px, py] == 0)
+        modules.append(row)
+    return modules
+
+
+def render_qr_to_text(image_path: str) -> str:
+    """把二维码截图渲染成终端字符（每行字符表示两行模块，浅色模块用方块表示）"""
+    modules = _read_modules(image_path)
+    if not modules:
+        return ""
+
+    width = len(modules[0]) + QUIET_ZONE * 2
+    blank = [False] * width
+    padded = [blank] * QUIET_ZONE
+    padded += [[False] * QUIET_ZONE + row + [False] * QUIET_ZONE for row in modules]
+    padded += [blank] * QUIET_ZONE
+    if len(padded) % 2:
+        padded.append(blank)
+
+    lines = []
+    for y in range(0, len(padded), 2):
+        line = []
+        for top, bottom in zip(padded[y], padded[y + 1]):
+            # 终端一般是深色背景，所以浅色模块输出方块、黑色模块输出空格
+            if not top and not bottom:
+                line.append('█')
+            elif not top:
+                line.append('▀')
+            elif not bottom:
+                line.append('▄')
+            else:
+                line.append(' ')
+        lines.append(''.join(line))
+    return '\n'.join(lines)
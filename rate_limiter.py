@@ -0,0 +1,116 @@
+import re
+import time
+import threading
+from contextlib import contextmanager
+
+CJK_PATTERN = re.compile(r'[\u3000-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(messages: list, max_tokens: int = 0) -> int:
+    """粗略估算一次请求消耗的token数：中文约每字1个token，其他字符约每4个1个token，再加上最多生成的token数"""
+    total = 0
+    for message in messages:
+        text = message.get('content') or ''
+        cjk = len(CJK_PATTERN.findall(text))
+        total += cjk + (len(text) - cjk) // 4 + 4
+    return total + max_tokens
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟额度，按秒匀速补充；额度不足时排队等待"""
+
+    def __init__(self, per_minute: float):
+        """初始化令牌桶"""
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+        # 等待者依次通过，先到先得，避免大请求一直被小请求插队
+        self._turnstile = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1):
+        """取出令牌，不足时阻塞到补足为止（超过容量的请求等桶满后放行）"""
+        amount = min(amount, self.capacity)
+        with self._turnstile:
+            while True:
+                with self._lock:
+                    self._refill()
+                    if self.tokens >= amount:
+                        self.tokens -= amount
+                        return
+                    wait = (amount - self.tokens) / self.rate
+                time.sleep(wait)
+
+    def adjust(self, amount: float):
+        """按实际用量修正：正数补扣，负数退还"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RateLimiter:
+    """LLM 客户端限流：每分钟请求数(RPM)、每分钟token数(TPM)两个令牌桶加并发上限，额度不足时排队等待而不是失败"""
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, key: str, settings: dict = None):
+        """获取同一服务商接口（地址+模型）对应的共享实例，进程内所有调用共用额度"""
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(settings)
+            return cls._shared[key]
+
+    def __init__(self, settings: dict = None):
+        """初始化限流器（额度为0表示不限制）"""
+        settings = settings or {}
+        rpm = settings.get('rpm', 0)
+        tpm = settings.get('tpm', 0)
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = threading.BoundedSemaphore(settings.get('max_concurrency', 4))
+        self.paused_until = 0
+        self.waited = 0.0
+        self.throttled = 0
+
+    @contextmanager
+    def acquire(self, estimated_tokens: int):
+        """等待额度和并发名额，产出后执行请求"""
+        start = time.monotonic()
+        self.concurrency.acquire()
+        try:
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            if self.requests:
+                self.requests.acquire(1)
+            if self.tokens:
+                self.tokens.acquire(estimated_tokens)
+            self.waited += time.monotonic() - start
+            yield
+        finally:
+            self.concurrency.release()
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """请求完成后用服务端返回的实际token数修正估算"""
+        if self.tokens and actual_tokens:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def throttle(self, retry_after: float):
+        """服务端返回429时暂停放行"""
+        self.throttled += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def stats(self) -> dict:
+        """统计信息"""
+        return {
+            'waited_seconds': round(self.waited, 1),
+            'throttled': self.throttled,
+        }
@@ -0,0 +1,48 @@
+import json
+import logging
+from pathlib import Path
+from datetime import datetime
+import clock
+
+
+def make_result(operation: str, account_name: str, target: str, success: bool,
+                started_at: float, error: str = None) -> dict:
+    """生成单个任务的结果记录"""
+    return {
+        'operation': operation,
+        'account': account_name,
+        'target': target,
+        'status': 'success' if success else 'failed',
+        'started_at': datetime.fromtimestamp(started_at).strftime('%Y-%m-%d %H:%M:%S'),
+        'duration': round(clock.now() - started_at, 3),
+        'error': error,
+    }
+
+
+class RunReport:
+    """运行报告：每完成一个任务就把结果追加写入JSONL文件"""
+
+    def __init__(self, report_file: str):
+        """打开报告文件（追加模式）"""
+        self.report_file = Path(report_file)
+        self.report_file.parent.mkdir(parents=True, exist_ok=True)
+        self.logger = logging.getLogger(__name__)
+        self._file = open(self.report_file, 'a', encoding='utf-8')
+
+    def write(self, record: dict):
+        """写入一条结果记录并立即落盘"""
+        try:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+        except Exception as e:
+            self.logger.error(f"写入运行报告失败: {e}")
+
+    def close(self):
+        """关闭报告文件"""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+
+# 各逻辑元素的候选选择器，按原始优先级排列
+DEFAULT_SELECTORS = {
+    'qr_login_button': ['text=扫码登录', 'text=二维码登录', '.qr-login-btn'],
+    'qr_code': ['.qr-code', '.qrcode', '[data-testid="qr-code"]'],
+    'user_avatar': ['[data-testid="user-avatar"]', '.avatar', '.user-avatar'],
+    'editor': ['div[contenteditable="true"]', 'textarea', '.editor'],
+    'upload_input': ['input[type="file"]', '.upload-btn', '[data-testid="upload"]'],
+    'publish_button': ['button:has-text("发布")', 'button:has-text("发 布")', '.publish-btn'],
+    'note_content': ['.content', '.note-content', '[data-testid="note-content"]'],
+    'comment_input': ['textarea[placeholder*="评论"]', 'input[placeholder*="评论"]', '.comment-input'],
+    'comment_button': ['button:has-text("评论")', '.comment-btn'],
+    'send_button': ['button:has-text("发送")', 'button:has-text("评论")', '.send-btn'],
+}
+
+# 连续失败达到该次数的选择器视为失效
+FAILING_THRESHOLD = 3
+# 命中统计有变化后最多间隔多久写一次文件（秒），退出时调用 flush() 写入剩余的变化
+SAVE_INTERVAL_SECONDS = 60
+
+
+class SelectorRegistry:
+    """自学习选择器缓存：记录每个逻辑元素实际命中的候选选择器，优先尝试命中最多的那个"""
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, stats_file: str, fast_timeout: int = 1500):
+        """获取同一统计文件对应的共享实例，避免多个模块互相覆盖统计数据"""
+        key = str(Path(stats_file).resolve())
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(stats_file, fast_timeout)
+            return cls._shared[key]
+
+    def __init__(self, stats_file: str, fast_timeout: int = 1500):
+        """初始化选择器注册表"""
+        self.stats_file = Path(stats_file)
+        self.stats_file.parent.mkdir(parents=True, exist_ok=True)
+        self.fast_timeout = fast_timeout
+        self.logger = logging.getLogger(__name__)
+
+        self.selectors = {name: list(alternatives) for name, alternatives in DEFAULT_SELECTORS.items()}
+        self.stats = self._load_stats()
+        # 主线程和Cookie刷新线程共用同一实例，修改和保存统计时加锁
+        self._lock = threading.RLock()
+        # 统计有未保存的变化；查找元素时只标记，定期或退出时再写文件
+        self._dirty = False
+        self._saved_at = time.time()
+
+    def _load_stats(self) -> dict:
+        """加载命中统计"""
+        if self.stats_file.exists():
+            try:
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                self.logger.error(f"加载选择器统计失败: {e}")
+        return {}
+
+    def save(self):
+        """保存命中统计（先写临时文件再替换，中途出错不会破坏原文件）"""
+        with self._lock:
+            try:
+                tmp_file = self.stats_file.with_suffix(f'.{os.getpid()}.tmp')
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.stats, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_file, self.stats_file)
+                self._dirty = False
+            except Exception as e:
+                self.logger.error(f"保存选择器统计失败: {e}")
+            self._saved_at = time.time()
+
+    def flush(self):
+        """有未保存的变化时写入文件（退出前调用）"""
+        with self._lock:
+            if self._dirty:
+                self.save()
+
+    def _mark_dirty(self):
+        """标记统计已变化，距上次保存超过 SAVE_INTERVAL_SECONDS 时顺便保存（需持有锁）"""
+        self._dirty = True
+        if time.time() - self._saved_at >= SAVE_INTERVAL_SECONDS:
+            self.save()
+
+    def _selector_stats(self, name: str, selector: str) -> dict:
+        """获取单个选择器的统计项"""
+        element_stats = self.stats.setdefault(name, {})
+        return element_stats.setdefault(selector, {
+            'hits': 0,
+            'misses': 0,
+            'consecutive_misses': 0,
+            'last_hit': None,
+        })
+
+    def ordered(self, name: str) -> list:
+        """按命中情况排序候选选择器：最近可用且命中最多的排在前面"""
+        alternatives = self.selectors[name]
+
+        with self._lock:
+            element_stats = self.stats.get(name, {})
+
+            def sort_key(item):
+                index, selector = item
+                stats = element_stats.get(selector, {})
+                return (stats.get('consecutive_misses', 0) > 0, -stats.get('hits', 0), index)
+
+            return [selector for _, selector in sorted(enumerate(alternatives), key=sort_key)]
+
+    def _record_hit(self, name: str, selector: str):
+        """记录命中"""
+        with self._lock:
+            stats = self._selector_stats(name, selector)
+            stats['hits'] += 1
+            stats['consecutive_misses'] = 0
+            stats['last_hit'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            self._mark_dirty()
+
+    def _record_miss(self, name: str, selector: str):
+        """记录未命中，曾经命中过的选择器开始失效时立即告警"""
+        with self._lock:
+            stats = self._selector_stats(name, selector)
+            stats['misses'] += 1
+            stats['consecutive_misses'] += 1
+            failing = stats['hits'] and stats['consecutive_misses'] == FAILING_THRESHOLD
+            self._mark_dirty()
+        if failing:
+            self.logger.warning(f"选择器可能已失效（页面结构可能已变化）: {name} -> {selector}")
+
+    def find(self, page, name: str, timeout: int = 0, state: str = 'visible'):
+        """查找逻辑元素，返回匹配的Locator，找不到时返回None
+
+        用所有候选组成的组合选择器一次等待（最长 timeout 毫秒，且不少于每个候选 fast_timeout 毫秒之和），
+        元素出现后按历史命中顺序找出实际命中的选择器；排在它前面的候选记为未命中。
+        """
+        alternatives = self.ordered(name)
+        combined = page.locator(', '.join(alternatives)).first
+        try:
+            combined.wait_for(state=state, timeout=max(timeout, self.fast_timeout * len(alternatives)))
+        except Exception:
+            for selector in alternatives:
+                self._record_miss(name, selector)
+            return None
+
+        skipped = []
+        for selector in alternatives:
+            locator = page.locator(selector).first
+            try:
+                matched = locator.count() and (state != 'visible' or locator.is_visible())
+            except Exception:
+                matched = False
+            if matched:
+                for missed in skipped:
+                    self._record_miss(name, missed)
+                self._record_hit(name, selector)
+                return locator
+            skipped.append(selector)
+        # 元素在等待结束后又消失，无法确定命中的是哪个候选，不记录统计
+        return combined
+
+    def is_visible(self, page, name: str) -> bool:
+        """不等待地检查元素是否可见，用于轮询场景（不记录未命中）"""
+        for selector in self.ordered(name):
+            try:
+                if page.locator(selector).first.is_visible():
+                    self._record_hit(name, selector)
+                    return True
+            except Exception:
+                continue
+        return False
+
+    def failing_selectors(self) -> list:
+        """返回曾经命中、但最近连续失败的选择器 [(元素名, 选择器, 连续失败次数)]"""
+        failing = []
+        with self._lock:
+            for name, element_stats in self.stats.items():
+                for selector, stats in element_stats.items():
+                    if stats.get('hits') and stats.get('consecutive_misses', 0) >= FAILING_THRESHOLD:
+                        failing.append((name, selector, stats['consecutive_misses']))
+        return failing
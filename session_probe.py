@@ -0,0 +1,89 @@
+import time
+import logging
+from http.cookiejar import DefaultCookiePolicy
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from note_cache import USER_AGENT
+
+# 只需要登录态、响应很小的接口：已登录时返回当前用户信息，未登录时返回游客标记
+DEFAULT_ENDPOINT = "https://edith.xiaohongshu.com/api/sns/web/v2/user/me"
+
+
+class SessionProbe:
+    """不启动浏览器的登录状态探测：用连接池复用的HTTP会话携带已保存的Cookie请求一个轻量接口
+
+    probe() 返回 True（有效）、False（已失效）或 None（无法判断，需要用浏览器确认）。
+    """
+
+    def __init__(self, settings: dict = None, auth_cookies: list = None):
+        """初始化探测器"""
+        settings = settings or {}
+        self.endpoint = settings.get('endpoint', DEFAULT_ENDPOINT)
+        self.timeout = settings.get('timeout_seconds', 5)
+        self.max_workers = settings.get('max_workers', 8)
+        self.auth_cookies = auth_cookies or ['web_session']
+        self.logger = logging.getLogger(__name__)
+
+        self.session = requests.Session()
+        # 每个请求显式携带账号Cookie，会话本身不保存任何Cookie，避免账号之间串号
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Accept": "application/json, text/plain, */*",
+            "Origin": "https://www.xiaohongshu.com",
+            "Referer": "https://www.xiaohongshu.com/",
+        })
+
+    @staticmethod
+    def _cookie_header(cookies: list) -> str:
+        """拼接发往小红书域名的Cookie请求头"""
+        return "; ".join(
+            f"{c['name']}={c['value']}" for c in cookies
+            if 'xiaohongshu.com' in c.get('domain', 'xiaohongshu.com')
+        )
+
+    def probe(self, cookies: list):
+        """探测一组Cookie的登录状态"""
+        now = time.time()
+        auth = [c for c in cookies if c.get('name') in self.auth_cookies]
+        if not auth:
+            return False
+        if all(0 < c.get('expires', -1) < now for c in auth):
+            return False
+
+        try:
+            response = self.session.get(self.endpoint, headers={"Cookie": self._cookie_header(cookies)},
+                                        timeout=self.timeout)
+        except requests.RequestException as e:
+            self.logger.debug(f"会话探测请求失败: {e}")
+            return None
+
+        if response.status_code in (401, 403):
+            return False
+        if response.status_code != 200:
+            # 461 等状态码表示触发了风控验证，无法判断
+            return None
+
+        try:
+            payload = response.json()
+        except ValueError:
+            return None
+
+        data = payload.get('data') or {}
+        if payload.get('success') and data.get('guest') is False:
+            return True
+        if data.get('guest') is True or payload.get('code') == -100:
+            return False
+        return None
+
+    def probe_many(self, account_cookies: dict) -> dict:
+        """并行探测多个账号 {账号: Cookie列表}，返回 {账号: True/False/None}"""
+        if not account_cookies:
+            return {}
+        names = list(account_cookies)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(names))) as executor:
+            results = executor.map(lambda name: self.probe(account_cookies[name]), names)
+            return dict(zip(names, results))
@@ -0,0 +1,50 @@
+import logging
+import clock
+
+DEFAULT_POLICY = {'attempts': 2, 'backoff_ms': 2000}
+
+
+class StepFailed(Exception):
+    """某个步骤用完重试次数后仍然失败"""
+
+    def __init__(self, step: str, cause: Exception):
+        super().__init__(f"步骤 {step} 失败: {cause}")
+        self.step = step
+        self.cause = cause
+
+
+class StepRunner:
+    """按顺序执行一个流程中的各个步骤（打开页面、填写、上传、提交、确认等）
+
+    每个步骤按自己的重试策略重试，重试只重做失败的步骤，已完成的步骤在同一个页面中保留，不从头再来。
+    """
+
+    def __init__(self, flow: str, policies: dict = None):
+        """初始化，policies 为 {步骤名: {'attempts': 次数, 'backoff_ms': 重试间隔}}，default 为默认策略"""
+        self.flow = flow
+        self.policies = policies or {}
+        self.completed = []
+        self.logger = logging.getLogger(__name__)
+
+    def _policy(self, step: str) -> dict:
+        return {**DEFAULT_POLICY, **self.policies.get('default', {}), **self.policies.get(step, {})}
+
+    def run(self, step: str, action, *args, **kwargs):
+        """执行一个步骤并返回其结果，所有尝试都失败时抛出 StepFailed"""
+        policy = self._policy(step)
+        attempts = max(1, policy['attempts'])
+        for attempt in range(1, attempts + 1):
+            try:
+                result = action(*args, **kwargs)
+            except Exception as e:
+                if attempt == attempts:
+                    raise StepFailed(step, e) from e
+                self.logger.warning(f"{self.flow} 步骤 {step} 第 {attempt} 次失败，重试: {e}")
+                clock.sleep(policy['backoff_ms'] / 1000)
+                continue
+            self.completed.append(step)
+            return result
+
+    def describe(self) -> str:
+        """已完成的步骤，用于失败日志"""
+        return " → ".join(self.completed) or "无"
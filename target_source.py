@@ -0,0 +1,140 @@
+import csv
+import json
+import logging
+from pathlib import Path
+from comment_history import extract_note_id
+
+
+class ListTargetSource:
+    """内存列表形式的目标笔记来源（config.yaml 中的 target_notes 或 --note-urls）"""
+
+    def __init__(self, note_urls: list):
+        self.note_urls = note_urls
+
+    def __iter__(self):
+        seen = set()
+        for note_url in self.note_urls:
+            note_id = extract_note_id(note_url)
+            if note_id not in seen:
+                seen.add(note_id)
+                yield note_url
+
+    def commit(self):
+        """列表来源无需保存进度"""
+
+
+class FileTargetSource:
+    """JSONL/CSV 文件形式的目标笔记来源：逐行惰性读取、边读边去重，并按字节偏移保存读取进度
+
+    JSONL 每行可以是字符串，或包含 url / note_url 字段的对象；
+    CSV 有表头时读取 url / note_url 列，否则读取第一列（不支持跨行的引号字段）。
+    """
+
+    URL_FIELDS = ('url', 'note_url')
+
+    def __init__(self, path: str, checkpoint_file: str = None):
+        """初始化文件来源"""
+        self.path = Path(path)
+        self.checkpoint_file = Path(checkpoint_file) if checkpoint_file else self.path.with_name(self.path.name + ".checkpoint")
+        self.is_csv = self.path.suffix.lower() == '.csv'
+        self.logger = logging.getLogger(__name__)
+
+        self._last_offset = None
+
+    def _load_offset(self) -> int:
+        """读取上次处理到的字节偏移，文件被截断或替换时从头开始"""
+        if not self.checkpoint_file.exists():
+            return 0
+        try:
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                offset = json.load(f).get('offset', 0)
+        except Exception as e:
+            self.logger.error(f"读取目标笔记进度失败: {e}")
+            return 0
+        if offset > self.path.stat().st_size:
+            self.logger.warning(f"目标文件 {self.path} 比上次记录的进度短，从头开始读取")
+            return 0
+        return offset
+
+    def commit(self):
+        """保存最近一次产出的笔记之后的字节偏移，下次运行从这里继续"""
+        if self._last_offset is None:
+            return
+        try:
+            with open(self.checkpoint_file, 'w', encoding='utf-8') as f:
+                json.dump({'offset': self._last_offset}, f)
+        except Exception as e:
+            self.logger.error(f"保存目标笔记进度失败: {e}")
+
+    def reset(self):
+        """清除进度，下次从文件开头读取"""
+        if self.checkpoint_file.exists():
+            self.checkpoint_file.unlink()
+        self._last_offset = None
+
+    def _parse_jsonl(self, text: str) -> str:
+        """解析一行JSONL"""
+        item = json.loads(text)
+        if isinstance(item, str):
+            return item
+        for field in self.URL_FIELDS:
+            if item.get(field):
+                return item[field]
+        return ""
+
+    def _read_csv_header(self, f) -> int:
+        """读取CSV表头，返回笔记链接所在的列号；没有表头时回到文件开头"""
+        first_line = f.readline()
+        row = next(csv.reader([first_line.decode('utf-8-sig')]), [])
+        names = [name.strip().lower() for name in row]
+        for field in self.URL_FIELDS:
+            if field in names:
+                return names.index(field)
+        f.seek(0)
+        return 0
+
+    def __iter__(self):
+        if not self.path.exists():
+            self.logger.error(f"目标笔记文件不存在: {self.path}")
+            return
+
+        seen = set()
+        with open(self.path, 'rb') as f:
+            column = self._read_csv_header(f) if self.is_csv else 0
+            offset = self._load_offset()
+            if offset > f.tell():
+                f.seek(offset)
+                self.logger.info(f"从上次进度继续读取目标笔记: {self.path} (字节偏移 {offset})")
+
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                text = line.decode('utf-8-sig').strip()
+                if not text:
+                    continue
+
+                try:
+                    if self.is_csv:
+                        row = next(csv.reader([text]), [])
+                        note_url = row[column].strip() if len(row) > column else ""
+                    else:
+                        note_url = self._parse_jsonl(text)
+                except Exception as e:
+                    self.logger.warning(f"跳过无法解析的目标笔记行: {text[:80]} ({e})")
+                    continue
+
+                note_id = extract_note_id(note_url) if note_url else ""
+                if not note_id or note_id in seen:
+                    continue
+                seen.add(note_id)
+
+                self._last_offset = f.tell()
+                yield note_url
+
+
+def open_target_source(target):
+    """根据参数创建目标笔记来源：.jsonl/.csv 文件路径，或笔记链接列表"""
+    if isinstance(target, (str, Path)):
+        return FileTargetSource(target)
+    return ListTargetSource(target or [])
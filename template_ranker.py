@@ -0,0 +1,133 @@
+import re
+import zlib
+import random
+import hashlib
+import logging
+from pathlib import Path
+import numpy as np
+
+
+class TemplateRanker:
+    """离线评论模板排序：字符 n-gram TF-IDF 向量 + 余弦相似度，为笔记挑选最贴切的评论模板
+
+    n-gram 通过 crc32 哈希到固定维度，模板矩阵预先计算并缓存到磁盘，无需网络即可生成评论。
+    """
+
+    def __init__(self, templates: list, index_file: str = None, min_n: int = 1, max_n: int = 3,
+                 dim: int = 4096, top_k: int = 5):
+        """初始化并构建（或加载）模板向量"""
+        self.templates = [t.strip() for t in templates if t and t.strip()]
+        self.min_n = min_n
+        self.max_n = max_n
+        self.dim = dim
+        self.top_k = top_k
+        self.logger = logging.getLogger(__name__)
+
+        self.index_file = Path(index_file) if index_file else None
+        self.idf = None
+        self.matrix = None
+        if self.templates:
+            self._build()
+
+    @classmethod
+    def from_config(cls, config: dict, index_file: str = None):
+        """从配置创建：合并 comment_templates 与模板库文件"""
+        commenting = config['commenting']
+        templates = list(commenting.get('comment_templates', []))
+
+        library = commenting.get('template_library')
+        if library and Path(library).exists():
+            with open(library, 'r', encoding='utf-8') as f:
+                templates.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+
+        # 去重并保持顺序
+        templates = list(dict.fromkeys(templates))
+        return cls(templates, index_file)
+
+    def _ngrams(self, text: str):
+        """生成字符 n-gram"""
+        text = re.sub(r'\s+', ' ', text.lower()).strip()
+        for n in range(self.min_n, self.max_n + 1):
+            for i in range(len(text) - n + 1):
+                yield text[i:i + n]
+
+    def _counts(self, texts: list) -> np.ndarray:
+        """统计每段文本的哈希 n-gram 词频矩阵"""
+        counts = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets = [zlib.crc32(gram.encode('utf-8')) % self.dim for gram in self._ngrams(text)]
+            if buckets:
+                counts[row] = np.bincount(buckets, minlength=self.dim)
+        return counts
+
+    def _vectorize(self, counts: np.ndarray) -> np.ndarray:
+        """词频 -> 次线性 TF-IDF，并按行做 L2 归一化"""
+        vectors = np.log1p(counts) * self.idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def _signature(self) -> str:
+        """模板库与参数的签名，用于判断磁盘缓存是否可用"""
+        digest = hashlib.sha1(f"{self.min_n}-{self.max_n}-{self.dim}".encode('utf-8'))
+        for template in self.templates:
+            digest.update(template.encode('utf-8'))
+            digest.update(b'\n')
+        return digest.hexdigest()
+
+    def _build(self):
+        """构建模板矩阵，模板库未变化时直接加载缓存"""
+        signature = self._signature()
+        if self.index_file and self.index_file.exists():
+            try:
+                cached = np.load(self.index_file)
+                if str(cached['signature']) == signature:
+                    self.idf = cached['idf']
+                    self.matrix = cached['matrix']
+                    return
+            except Exception as e:
+                self.logger.warning(f"加载模板索引失败，重新构建: {e}")
+
+        counts = self._counts(self.templates)
+        df = (counts > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(self.templates)) / (1 + df)) + 1).astype(np.float32)
+        self.matrix = self._vectorize(counts).astype(np.float32)
+        self.logger.info(f"已构建评论模板索引: {len(self.templates)} 条模板")
+
+        if self.index_file:
+            try:
+                self.index_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.index_file, 'wb') as f:
+                    np.savez(f, signature=signature, idf=self.idf, matrix=self.matrix)
+            except Exception as e:
+                self.logger.warning(f"保存模板索引失败: {e}")
+
+    def score_batch(self, note_contents: list) -> np.ndarray:
+        """批量计算笔记与所有模板的余弦相似度，返回 (笔记数, 模板数) 矩阵"""
+        notes = self._vectorize(self._counts(note_contents))
+        return notes @ self.matrix.T
+
+    def select_batch(self, note_contents: list) -> list:
+        """为一批笔记各挑选一条评论：在相似度最高且分数接近的 top_k 条模板中随机选择，避免评论千篇一律"""
+        if not self.templates:
+            return [""] * len(note_contents)
+
+        scores = self.score_batch(note_contents)
+        k = min(self.top_k, len(self.templates))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        comments = []
+        for row, content in enumerate(note_contents):
+            if not content or not scores[row].any():
+                # 没有可比对的内容时退回随机模板
+                comments.append(random.choice(self.templates))
+            else:
+                # 只在与最佳模板分数接近的候选中随机
+                best = scores[row, top[row]].max()
+                candidates = [i for i in top[row] if scores[row, i] >= best * 0.8]
+                comments.append(self.templates[random.choice(candidates)])
+        return comments
+
+    def select(self, note_content: str) -> str:
+        """为单篇笔记挑选评论"""
+        return self.select_batch([note_content])[0]
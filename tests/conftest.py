@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 项目模块都在仓库根目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
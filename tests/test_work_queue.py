@@ -0,0 +1,95 @@
+import time
+from work_queue import SQLiteWorkQueue, QueueWorker
+
+
+def make_nodes(tmp_path, lease_seconds=60):
+    """同一个数据库文件上的两个节点"""
+    db_path = tmp_path / "work_queue.db"
+    return (SQLiteWorkQueue(db_path, "node-a", lease_seconds),
+            SQLiteWorkQueue(db_path, "node-b", lease_seconds))
+
+
+def success_record(job):
+    return {'operation': job['type'], 'account': job['account'], 'target': job['id'], 'status': 'success'}
+
+
+def test_lease_is_exclusive_per_account(tmp_path):
+    node_a, node_b = make_nodes(tmp_path)
+    node_a.enqueue('publish', '账号1', {'draft': 'a.txt'})
+    node_a.enqueue('publish', '账号1', {'draft': 'b.txt'})
+
+    first = node_a.claim_next()
+    assert first['account'] == '账号1'
+    # 账号1 由 node-a 持有租约，node-b 不能领取它的任务
+    assert node_b.claim_next() is None
+    # 同一账号同一时间只执行一个任务
+    assert node_a.claim_next() is None
+
+    node_a.complete(first['id'], success_record(first))
+    second = node_a.claim_next()
+    assert second['draft'] == 'b.txt'
+    assert node_b.claim_next() is None
+
+
+def test_idle_node_steals_unleased_account(tmp_path):
+    node_a, node_b = make_nodes(tmp_path)
+    node_a.enqueue('publish', '账号1', {'draft': 'a.txt'})
+    node_a.enqueue('comment', '账号2', {'note_url': 'https://example.com/explore/1'})
+
+    assert node_a.claim_next()['account'] == '账号1'
+    stolen = node_b.claim_next()
+    assert stolen['account'] == '账号2'
+    assert node_a.stats()['leases'] == {'账号1': 'node-a', '账号2': 'node-b'}
+
+
+def test_dedupe_key_enqueues_once(tmp_path):
+    node_a, node_b = make_nodes(tmp_path)
+    assert node_a.enqueue('publish', '账号1', {'draft': 'a.txt'}, dedupe_key='a')
+    assert not node_b.enqueue('publish', '账号1', {'draft': 'a.txt'}, dedupe_key='a')
+
+
+def test_orphaned_job_is_requeued_after_lease_expires(tmp_path):
+    node_a, node_b = make_nodes(tmp_path, lease_seconds=0.5)
+    node_a.enqueue('publish', '账号1', {'draft': 'a.txt'})
+
+    orphan = node_a.claim_next()
+    assert node_b.claim_next() is None
+
+    # node-a 宕机，不再发送心跳
+    time.sleep(0.6)
+    taken_over = node_b.claim_next()
+    assert taken_over['id'] == orphan['id']
+    assert node_b.stats()['leases'] == {'账号1': 'node-b'}
+
+
+def test_worker_survives_failing_job(tmp_path):
+    node_a, _ = make_nodes(tmp_path)
+    node_a.enqueue('publish', '账号1', {'draft': 'drafts/a.txt'})
+    node_a.enqueue('publish', '账号2', {'draft': 'drafts/b.txt'})
+
+    def run_job(job):
+        if job['draft'] == 'drafts/a.txt':
+            raise RuntimeError("浏览器启动失败")
+        return success_record(job)
+
+    records = list(QueueWorker(node_a, run_job).run(exit_when_idle=True))
+
+    assert [r['status'] for r in records] == ['failed', 'success']
+    assert records[0]['target'] == 'a.txt'
+    assert records[0]['error'] == 'RuntimeError'
+    assert node_a.stats()['jobs'] == {'failed': 1, 'done': 1}
+    assert [node for _, node, _ in node_a.results_since()] == ['node-a', 'node-a']
+
+
+def test_failed_job_can_be_enqueued_again(tmp_path):
+    node_a, _ = make_nodes(tmp_path)
+    assert node_a.enqueue('publish', '账号1', {'draft': 'a.txt'}, dedupe_key='a')
+
+    job = node_a.claim_next()
+    node_a.complete(job['id'], dict(success_record(job), status='failed'))
+
+    # 排除失败原因后同一篇文案可以重新入队，成功之后不再重复入队
+    assert node_a.enqueue('publish', '账号1', {'draft': 'a.txt'}, dedupe_key='a')
+    retry = node_a.claim_next()
+    node_a.complete(retry['id'], success_record(retry))
+    assert not node_a.enqueue('publish', '账号1', {'draft': 'a.txt'}, dedupe_key='a')
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+# 直方图桶上界(毫秒)：50ms 起按 1.2 倍递增，约覆盖到 73 秒
+BUCKET_BOUNDS = [round(50 * 1.2 ** i) for i in range(41)]
+
+# 每次记录时旧样本的衰减系数，使直方图反映近期的页面速度
+DECAY = 0.98
+
+
+class TimeoutManager:
+    """自适应超时：按步骤记录耗时直方图，超时 = 指定分位数 × 安全系数，并限制在上下限之间"""
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, stats_file: str, settings: dict = None):
+        """获取同一统计文件对应的共享实例"""
+        key = str(Path(stats_file).resolve())
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(stats_file, settings)
+            return cls._shared[key]
+
+    def __init__(self, stats_file: str, settings: dict = None):
+        """初始化超时管理器"""
+        settings = settings or {}
+        self.stats_file = Path(stats_file)
+        self.stats_file.parent.mkdir(parents=True, exist_ok=True)
+        self.percentile = settings.get('percentile', 95)
+        self.safety_factor = settings.get('safety_factor', 1.5)
+        self.min_samples = settings.get('min_samples', 5)
+        self.floor_ms = settings.get('floor_ms', 2000)
+        self.ceiling_ms = settings.get('ceiling_ms', 60000)
+        self.logger = logging.getLogger(__name__)
+
+        self.stats = self._load_stats()
+        # 主线程和Cookie刷新线程共用同一实例，修改和保存统计时加锁
+        self._lock = threading.RLock()
+
+    def _load_stats(self) -> dict:
+        """加载耗时统计"""
+        if self.stats_file.exists():
+            try:
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                self.logger.error(f"加载步骤耗时统计失败: {e}")
+        return {}
+
+    def save(self):
+        """保存耗时统计（先写临时文件再替换，中途出错不会破坏原文件）"""
+        with self._lock:
+            try:
+                tmp_file = self.stats_file.with_suffix(f'.{os.getpid()}.tmp')
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.stats, f, ensure_ascii=False)
+                os.replace(tmp_file, self.stats_file)
+            except Exception as e:
+                self.logger.error(f"保存步骤耗时统计失败: {e}")
+
+    def _step_stats(self, step: str) -> dict:
+        """获取步骤统计项"""
+        return self.stats.setdefault(step, {
+            'histogram': [0.0] * (len(BUCKET_BOUNDS) + 1),
+            'samples': 0,
+            'consecutive_timeouts': 0,
+        })
+
+    def record(self, step: str, elapsed_ms: float):
+        """记录一次成功步骤的耗时"""
+        bucket = len(BUCKET_BOUNDS)
+        for i, bound in enumerate(BUCKET_BOUNDS):
+            if elapsed_ms <= bound:
+                bucket = i
+                break
+
+        with self._lock:
+            stats = self._step_stats(step)
+            histogram = stats['histogram']
+            for i in range(len(histogram)):
+                histogram[i] *= DECAY
+            histogram[bucket] += 1
+            stats['samples'] += 1
+            stats['consecutive_timeouts'] = 0
+            self.save()
+
+    def record_timeout(self, step: str):
+        """记录一次超时（耗时未知，不计入直方图）"""
+        with self._lock:
+            stats = self._step_stats(step)
+            stats['consecutive_timeouts'] += 1
+            self.save()
+
+    def _percentile_ms(self, histogram: list) -> float:
+        """根据直方图估算分位数耗时（取所在桶的上界）"""
+        total = sum(histogram)
+        target = total * self.percentile / 100
+        cumulative = 0.0
+        for i, count in enumerate(histogram):
+            cumulative += count
+            if cumulative >= target:
+                return BUCKET_BOUNDS[min(i, len(BUCKET_BOUNDS) - 1)]
+        return BUCKET_BOUNDS[-1]
+
+    def timeout_for(self, step: str, default_ms: int) -> int:
+        """计算步骤的超时时间(毫秒)，样本不足时使用默认值"""
+        with self._lock:
+            stats = self.stats.get(step)
+            if not stats or stats['samples'] < self.min_samples:
+                return default_ms
+
+            # 连续超时说明页面明显变慢，直接放宽到上限，等新的成功样本把超时拉回来
+            if stats['consecutive_timeouts'] >= 2:
+                return self.ceiling_ms
+
+            timeout = self._percentile_ms(stats['histogram']) * self.safety_factor
+        return int(min(max(timeout, self.floor_ms), self.ceiling_ms))
+
+    @contextmanager
+    def step(self, step: str, default_ms: int):
+        """计时上下文：产出本步骤的超时时间，正常结束记录耗时，Playwright 等待超时时记录超时
+
+        其他异常（选择器错误、已发布过等）与页面速度无关，不计入统计，直接抛出。
+        """
+        timeout = self.timeout_for(step, default_ms)
+        start = time.time()
+        try:
+            yield timeout
+        except PlaywrightTimeoutError:
+            self.record_timeout(step)
+            raise
+        self.record(step, (time.time() - start) * 1000)
@@ -0,0 +1,152 @@
+import re
+import time
+import logging
+from pathlib import Path
+
+# 默认按URL识别图片上传请求
+DEFAULT_UPLOAD_PATTERNS = [r'ros-upload', r'/upload']
+# 表单上传时请求体比文件多出的字节数上限（边界、字段等），超出则不认为是该文件的上传
+BODY_OVERHEAD_BYTES = 64 * 1024
+BODY_OVERHEAD_RATIO = 0.05
+
+
+class UploadTracker:
+    """通过页面的 request/response 事件跟踪图片上传
+
+    每个上传请求按请求体大小对应到一个文件，所有文件的响应都成功返回时即判定上传完成，
+    同时记录每个文件的字节数、耗时和吞吐量。
+    """
+
+    def __init__(self, page, files: list, url_patterns: list = None):
+        """初始化跟踪器，files 为要上传的文件路径"""
+        self.page = page
+        self.patterns = [re.compile(p) for p in (url_patterns or DEFAULT_UPLOAD_PATTERNS)]
+        self.logger = logging.getLogger(__name__)
+
+        # 文件路径 -> 上传记录
+        self.uploads = {
+            str(path): {'file': Path(path).name, 'size': Path(path).stat().st_size, 'bytes': 0,
+                        'started': None, 'finished': None, 'status': None}
+            for path in files
+        }
+        # 请求 -> 文件路径
+        self._requests = {}
+        self.requests_seen = 0
+        self.failures = 0
+
+    def _is_upload(self, request) -> bool:
+        return request.method in ('POST', 'PUT') and any(p.search(request.url) for p in self.patterns)
+
+    @staticmethod
+    def _body_size(request) -> int:
+        """请求体字节数；大文件的请求体可能拿不到，退回到 Content-Length"""
+        try:
+            body = request.post_data_buffer
+            if body:
+                return len(body)
+        except Exception:
+            pass
+        try:
+            return int(request.headers.get('content-length', 0))
+        except ValueError:
+            return 0
+
+    def _match_file(self, size: int) -> str:
+        """找到与请求体大小最接近的未开始上传的文件（表单上传的请求体比文件略大）
+
+        请求体比所有待上传文件都小或大出太多时不对应任何文件，
+        避免把获取上传凭证等小请求当成图片上传。
+        """
+        fitting = []
+        for path, upload in self.uploads.items():
+            if upload['started'] is not None:
+                continue
+            overhead = size - upload['size']
+            if 0 <= overhead <= max(BODY_OVERHEAD_BYTES, upload['size'] * BODY_OVERHEAD_RATIO):
+                fitting.append((overhead, path))
+        if not fitting:
+            return None
+        return min(fitting)[1]
+
+    def _on_request(self, request):
+        if not self._is_upload(request):
+            return
+        size = self._body_size(request)
+        path = self._match_file(size)
+        if path is None:
+            self.logger.debug(f"忽略与待上传文件大小不符的请求: {request.url} ({size} 字节)")
+            return
+        self.requests_seen += 1
+        self._requests[request] = path
+        self.uploads[path]['bytes'] = size
+        self.uploads[path]['started'] = time.time()
+
+    def _on_response(self, response):
+        path = self._requests.pop(response.request, None)
+        if path is None:
+            return
+        self.uploads[path]['finished'] = time.time()
+        self.uploads[path]['status'] = response.status
+        if not response.ok:
+            self.failures += 1
+
+    def _on_request_failed(self, request):
+        path = self._requests.pop(request, None)
+        if path is None:
+            return
+        self.uploads[path]['finished'] = time.time()
+        self.uploads[path]['status'] = 'failed'
+        self.failures += 1
+
+    def start(self):
+        """开始监听（需在设置上传文件之前调用）"""
+        self.page.on("request", self._on_request)
+        self.page.on("response", self._on_response)
+        self.page.on("requestfailed", self._on_request_failed)
+
+    def stop(self):
+        """停止监听"""
+        self.page.remove_listener("request", self._on_request)
+        self.page.remove_listener("response", self._on_response)
+        self.page.remove_listener("requestfailed", self._on_request_failed)
+
+    def completed(self) -> int:
+        """已成功上传的文件数"""
+        return sum(1 for upload in self.uploads.values()
+                   if isinstance(upload['status'], int) and 200 <= upload['status'] < 400)
+
+    def wait(self, timeout_ms: int, first_request_ms: int = 5000) -> bool:
+        """等待所有文件上传完成；有文件上传失败时立即返回False
+
+        first_request_ms 内没有出现任何上传请求时（可能是上传地址规则不匹配）也返回False，
+        调用方根据 requests_seen 判断是否改用页面提示确认。
+        """
+        started = time.time()
+        while True:
+            if self.completed() == len(self.uploads) or self.failures:
+                break
+            elapsed = (time.time() - started) * 1000
+            if elapsed >= timeout_ms or (not self.requests_seen and elapsed >= first_request_ms):
+                break
+            # 在Playwright调用中等待，期间会分发网络事件
+            self.page.wait_for_timeout(100)
+        return self.completed() == len(self.uploads)
+
+    def metrics(self) -> list:
+        """每个文件的上传指标 [{'file', 'bytes', 'duration', 'throughput_kbps', 'status'}]"""
+        metrics = []
+        for upload in self.uploads.values():
+            duration = None
+            throughput = None
+            if upload['started'] and upload['finished']:
+                duration = round(upload['finished'] - upload['started'], 3)
+                if duration > 0:
+                    throughput = round(upload['bytes'] / 1024 / duration, 1)
+            metrics.append({
+                'file': upload['file'],
+                'bytes': upload['bytes'],
+                'duration': duration,
+                'throughput_kbps': throughput,
+                'status': upload['status'],
+            })
+        return metrics
@@ -0,0 +1,406 @@
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+import clock
+from run_report import make_result
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+def default_node_id() -> str:
+    """节点ID：主机名 + 随机后缀，同一台机器上的多个进程也能区分"""
+    return f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+
+
+class SQLiteWorkQueue:
+    """基于 SQLite 文件的任务队列（单机或共享文件系统上的测试替身）
+
+    - 每个账号同一时间只由一个节点持有租约，租约靠心跳续期，节点宕机后租约过期即可被其他节点接管
+    - 空闲节点可以领取任何未被租用账号的任务（工作窃取）
+    - 所有节点的结果写入同一张结果表，可按ID增量读取
+    """
+
+    def __init__(self, db_path: str, node_id: str = None, lease_seconds: int = 60):
+        """初始化队列并建表"""
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.node_id = node_id or default_node_id()
+        self.lease_seconds = lease_seconds
+        self.logger = logging.getLogger(__name__)
+        self._local = threading.local()
+
+        # executescript 会自行提交，不放在事务中
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT NOT NULL,
+                account TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                dedupe_key TEXT UNIQUE,
+                status TEXT NOT NULL DEFAULT 'queued',
+                node TEXT,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, account);
+            CREATE TABLE IF NOT EXISTS leases (
+                account TEXT PRIMARY KEY,
+                node TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER NOT NULL,
+                node TEXT NOT NULL,
+                record TEXT NOT NULL
+            );
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接（心跳线程与工作线程分开）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        """立即加写锁的事务，保证领取任务和抢租约的原子性"""
+        queue = self
+
+        class Transaction:
+            def __enter__(self):
+                self.conn = queue._conn()
+                self.conn.execute("BEGIN IMMEDIATE")
+                return self.conn
+
+            def __exit__(self, exc_type, exc, tb):
+                self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+        return Transaction()
+
+    def enqueue(self, job_type: str, account_name: str, payload: dict, dedupe_key: str = None) -> bool:
+        """添加任务；dedupe_key 相同的任务只会入队一次（多个节点同时入队同一篇文案也不会重复）"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (type, account, payload, dedupe_key, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                (job_type, account_name, json.dumps(payload, ensure_ascii=False), dedupe_key, time.time())
+            )
+            return cursor.rowcount > 0
+
+    def _requeue_orphaned(self, conn, now: float):
+        """把租约已过期节点上的运行中任务放回队列（节点宕机恢复）"""
+        conn.execute("""
+            UPDATE jobs SET status = 'queued', node = NULL, started_at = NULL
+            WHERE status = 'running' AND NOT EXISTS (
+                SELECT 1 FROM leases
+                WHERE leases.account = jobs.account AND leases.node = jobs.node AND leases.expires_at > ?
+            )
+        """, (now,))
+
+    def claim_next(self):
+        """领取下一个任务：优先本节点已持有租约的账号，其次任何未被租用的账号（工作窃取）
+
+        返回 {'id', 'type', 'account', **payload}，没有可领取的任务时返回 None。
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._requeue_orphaned(conn, now)
+            row = conn.execute("""
+                SELECT jobs.id, jobs.type, jobs.account, jobs.payload
+                FROM jobs LEFT JOIN leases
+                    ON leases.account = jobs.account AND leases.expires_at > ?
+                WHERE jobs.status = 'queued' AND (leases.node IS NULL OR leases.node = ?)
+                    AND NOT EXISTS (
+                        SELECT 1 FROM jobs AS running
+                        WHERE running.account = jobs.account AND running.status = 'running'
+                    )
+                ORDER BY (leases.node = ?) DESC, jobs.id
+                LIMIT 1
+            """, (now, self.node_id, self.node_id)).fetchone()
+            if row is None:
+                return None
+
+            job_id, job_type, account_name, payload = row
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (account, node, expires_at) VALUES (?, ?, ?)",
+                (account_name, self.node_id, now + self.lease_seconds)
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'running', node = ?, started_at = ? WHERE id = ?",
+                (self.node_id, now, job_id)
+            )
+
+        job = json.loads(payload)
+        job.update({'id': job_id, 'type': job_type, 'account': account_name})
+        return job
+
+    def heartbeat(self) -> int:
+        """续期本节点持有的所有租约，返回续期的账号数"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE node = ? AND expires_at > ?",
+                (time.time() + self.lease_seconds, self.node_id, time.time())
+            )
+            return cursor.rowcount
+
+    def complete(self, job_id: int, record: dict):
+        """完成任务并写入共享结果流；该账号没有剩余任务时释放租约，方便其他节点接手
+
+        失败的任务会释放去重键，排除原因后可以重新入队。
+        """
+        status = 'done' if record.get('status') == 'success' else 'failed'
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, "
+                "dedupe_key = CASE WHEN ? = 'failed' THEN NULL ELSE dedupe_key END WHERE id = ?",
+                (status, time.time(), status, job_id)
+            )
+            conn.execute(
+                "INSERT INTO results (job_id, node, record) VALUES (?, ?, ?)",
+                (job_id, self.node_id, json.dumps(record, ensure_ascii=False))
+            )
+            account_name = conn.execute("SELECT account FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            remaining = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE account = ? AND status = 'queued'", (account_name,)
+            ).fetchone()[0]
+            if not remaining:
+                conn.execute("DELETE FROM leases WHERE account = ? AND node = ?", (account_name, self.node_id))
+
+    def release_all(self):
+        """释放本节点的所有租约（节点正常退出时调用）"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE node = ?", (self.node_id,))
+
+    def results_since(self, last_id: int = 0, limit: int = 100) -> list:
+        """增量读取共享结果流，返回 [(结果ID, 节点ID, 结果记录)]"""
+        rows = self._conn().execute(
+            "SELECT id, node, record FROM results WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+        ).fetchall()
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def stats(self) -> dict:
+        """各状态的任务数和当前租约"""
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        leases = dict(conn.execute(
+            "SELECT account, node FROM leases WHERE expires_at > ?", (time.time(),)
+        ).fetchall())
+        return {'jobs': counts, 'leases': leases}
+
+
+class RedisWorkQueue:
+    """基于 Redis 的任务队列（多台主机共享），语义与 SQLiteWorkQueue 相同
+
+    键结构：
+    - {prefix}:queue:<账号>    每个账号的任务列表
+    - {prefix}:accounts        有待处理任务的账号集合
+    - {prefix}:lease:<账号>    账号租约（值为节点ID，带过期时间）
+    - {prefix}:running:<节点>  节点正在执行的任务（账号 -> 任务JSON），用于宕机恢复
+    - {prefix}:dedupe          已入队且未失败的任务的去重键
+    - {prefix}:results         共享结果流（Redis Stream）
+    """
+
+    # 只有租约持有者才能续期
+    RENEW_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('pexpire', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+
+    def __init__(self, url: str, node_id: str = None, lease_seconds: int = 60, prefix: str = "xhs"):
+        """连接 Redis"""
+        if redis is None:
+            raise ImportError("使用 Redis 队列需要安装 redis: pip install redis")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.node_id = node_id or default_node_id()
+        self.lease_seconds = lease_seconds
+        self.prefix = prefix
+        self.logger = logging.getLogger(__name__)
+        self._renew = self.client.register_script(self.RENEW_SCRIPT)
+
+    def _key(self, *parts) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    def enqueue(self, job_type: str, account_name: str, payload: dict, dedupe_key: str = None) -> bool:
+        """添加任务，dedupe_key 相同的任务只会入队一次"""
+        if dedupe_key and not self.client.sadd(self._key('dedupe'), dedupe_key):
+            return False
+        job_id = self.client.incr(self._key('job_id'))
+        job = dict(payload, id=job_id, type=job_type, account=account_name)
+        if dedupe_key:
+            # 任务失败时据此释放去重键
+            job['dedupe_key'] = dedupe_key
+        pipe = self.client.pipeline()
+        pipe.rpush(self._key('queue', account_name), json.dumps(job, ensure_ascii=False))
+        pipe.sadd(self._key('accounts'), account_name)
+        pipe.execute()
+        return True
+
+    def _requeue_orphaned(self):
+        """把租约已过期节点上的运行中任务放回各账号队列头部"""
+        for running_key in self.client.scan_iter(self._key('running', '*')):
+            node = running_key.rsplit(':', 1)[-1]
+            for account_name, job in self.client.hgetall(running_key).items():
+                if self.client.get(self._key('lease', account_name)) == node:
+                    continue
+                if self.client.hdel(running_key, account_name):
+                    self.client.lpush(self._key('queue', account_name), job)
+                    self.client.sadd(self._key('accounts'), account_name)
+
+    def _try_lease(self, account_name: str) -> bool:
+        """获取账号租约（已由本节点持有时续期）"""
+        lease_key = self._key('lease', account_name)
+        if self.client.set(lease_key, self.node_id, nx=True, px=self.lease_seconds * 1000):
+            return True
+        return bool(self._renew(keys=[lease_key], args=[self.node_id, self.lease_seconds * 1000]))
+
+    def claim_next(self):
+        """领取下一个任务：优先本节点已持有租约的账号，其次任何未被租用的账号（工作窃取）"""
+        self._requeue_orphaned()
+        accounts = list(self.client.smembers(self._key('accounts')))
+        held = [a for a in accounts if self.client.get(self._key('lease', a)) == self.node_id]
+        running = self.client.hkeys(self._key('running', self.node_id))
+
+        for account_name in held + [a for a in accounts if a not in held]:
+            if account_name in running or not self._try_lease(account_name):
+                continue
+            raw = self.client.lpop(self._key('queue', account_name))
+            if raw is None:
+                self.client.srem(self._key('accounts'), account_name)
+                self.client.delete(self._key('lease', account_name))
+                continue
+            self.client.hset(self._key('running', self.node_id), account_name, raw)
+            return json.loads(raw)
+        return None
+
+    def heartbeat(self) -> int:
+        """续期本节点持有的所有租约"""
+        renewed = 0
+        for account_name in self.client.hkeys(self._key('running', self.node_id)):
+            renewed += bool(self._renew(
+                keys=[self._key('lease', account_name)],
+                args=[self.node_id, self.lease_seconds * 1000]
+            ))
+        return renewed
+
+    def complete(self, job_id: int, record: dict):
+        """完成任务并写入共享结果流；该账号没有剩余任务时释放租约；失败的任务释放去重键"""
+        account_name = record['account']
+        raw = self.client.hget(self._key('running', self.node_id), account_name)
+        dedupe_key = json.loads(raw).get('dedupe_key') if raw else None
+        pipe = self.client.pipeline()
+        pipe.hdel(self._key('running', self.node_id), account_name)
+        if dedupe_key and record.get('status') != 'success':
+            pipe.srem(self._key('dedupe'), dedupe_key)
+        pipe.xadd(self._key('results'), {
+            'job_id': job_id,
+            'node': self.node_id,
+            'record': json.dumps(record, ensure_ascii=False),
+        })
+        pipe.execute()
+        if not self.client.llen(self._key('queue', account_name)):
+            if self.client.get(self._key('lease', account_name)) == self.node_id:
+                self.client.delete(self._key('lease', account_name))
+
+    def release_all(self):
+        """释放本节点的所有租约，并把未完成的任务放回队列"""
+        running_key = self._key('running', self.node_id)
+        for account_name, job in self.client.hgetall(running_key).items():
+            self.client.lpush(self._key('queue', account_name), job)
+            self.client.sadd(self._key('accounts'), account_name)
+        self.client.delete(running_key)
+        for lease_key in self.client.scan_iter(self._key('lease', '*')):
+            if self.client.get(lease_key) == self.node_id:
+                self.client.delete(lease_key)
+
+    def results_since(self, last_id: str = '0', limit: int = 100) -> list:
+        """增量读取共享结果流，返回 [(结果ID, 节点ID, 结果记录)]"""
+        entries = self.client.xrange(self._key('results'), min=f"({last_id}" if last_id != '0' else '-', count=limit)
+        return [(entry_id, fields['node'], json.loads(fields['record'])) for entry_id, fields in entries]
+
+    def stats(self) -> dict:
+        """各账号待处理任务数和当前租约"""
+        queued = {}
+        for account_name in self.client.smembers(self._key('accounts')):
+            queued[account_name] = self.client.llen(self._key('queue', account_name))
+        leases = {}
+        for lease_key in self.client.scan_iter(self._key('lease', '*')):
+            leases[lease_key.rsplit(':', 1)[-1]] = self.client.get(lease_key)
+        return {'jobs': {'queued': sum(queued.values())}, 'queued_by_account': queued, 'leases': leases}
+
+
+def create_work_queue(config: dict, node_id: str = None):
+    """根据配置创建任务队列：配置了 redis_url 时使用 Redis，否则使用 SQLite 文件"""
+    settings = config.get('work_queue', {})
+    lease_seconds = settings.get('lease_seconds', 60)
+    if settings.get('redis_url'):
+        return RedisWorkQueue(settings['redis_url'], node_id, lease_seconds)
+    return SQLiteWorkQueue(settings.get('sqlite_path', 'data/work_queue.db'), node_id, lease_seconds)
+
+
+class QueueWorker:
+    """队列工作节点：领取任务并执行，后台线程定期发送心跳续期租约"""
+
+    def __init__(self, work_queue, run_job, poll_interval: float = 5):
+        """run_job(job) -> 结果记录"""
+        self.work_queue = work_queue
+        self.run_job = run_job
+        self.poll_interval = poll_interval
+        self.logger = logging.getLogger(__name__)
+        self._stop_event = threading.Event()
+
+    def _heartbeat_loop(self):
+        """按租约时长的三分之一发送心跳"""
+        interval = max(self.work_queue.lease_seconds / 3, 1)
+        while not self._stop_event.wait(interval):
+            try:
+                self.work_queue.heartbeat()
+            except Exception as e:
+                self.logger.error(f"发送心跳失败: {e}")
+
+    def run(self, exit_when_idle: bool = False):
+        """循环领取并执行任务，逐条产出结果记录"""
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="queue-heartbeat", daemon=True)
+        heartbeat.start()
+        self.logger.info(f"队列工作节点已启动: {self.work_queue.node_id}")
+
+        try:
+            while not self._stop_event.is_set():
+                job = self.work_queue.claim_next()
+                if job is None:
+                    if exit_when_idle:
+                        break
+                    self._stop_event.wait(self.poll_interval)
+                    continue
+
+                self.logger.info(f"领取任务 #{job['id']}: {job['type']} (账号: {job['account']})")
+                started_at = clock.now()
+                try:
+                    record = self.run_job(job)
+                except Exception as e:
+                    # 浏览器启动失败等：记为失败并释放任务，继续领取下一个
+                    self.logger.error(f"执行任务 #{job['id']} 时出现错误: {e}", exc_info=True)
+                    target = Path(job['draft']).name if job.get('draft') else job.get('note_url', job['account'])
+                    record = make_result(job['type'], job['account'], target, False, started_at, type(e).__name__)
+                record['node'] = self.work_queue.node_id
+                self.work_queue.complete(job['id'], record)
+                yield record
+        finally:
+            self._stop_event.set()
+            self.work_queue.release_all()
+            self.logger.info(f"队列工作节点已停止: {self.work_queue.node_id}")
+
+    def stop(self):
+        """停止工作节点"""
+        self._stop_event.set()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+小红书自动运营系统 - 守护进程客户端
+向 python main.py --mode daemon 启动的守护进程提交任务（只依赖标准库，启动很快）
+"""
+
+import argparse
+import json
+import socket
+import sys
+
+
+def send_request(request: dict, socket_path: str = None, port: int = None) -> dict:
+    """发送一个请求并等待结果"""
+    if port is None and hasattr(socket, 'AF_UNIX'):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+    else:
+        sock = socket.create_connection(('127.0.0.1', port or 8765))
+
+    with sock:
+        sock.sendall((json.dumps(request, ensure_ascii=False) + "\n").encode('utf-8'))
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        return {'ok': False, 'error': "守护进程没有返回结果"}
+    return json.loads(line.decode('utf-8'))
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="小红书自动运营系统守护进程客户端")
+    parser.add_argument("--socket", default="data/daemon.sock", help="守护进程Unix套接字路径")
+    parser.add_argument("--port", type=int, help="守护进程TCP端口（不使用Unix套接字时）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    publish = subparsers.add_parser("publish", help="发布一篇文案")
+    publish.add_argument("--account", required=True, help="账号名称")
+    publish.add_argument("--draft", required=True, help="文案文件路径")
+
+    comment = subparsers.add_parser("comment", help="评论一篇笔记")
+    comment.add_argument("--account", required=True, help="账号名称")
+    comment.add_argument("--note-url", required=True, help="笔记链接")
+
+    verify = subparsers.add_parser("verify", help="验证账号登录状态")
+    verify.add_argument("--account", required=True, help="账号名称")
+
+    subparsers.add_parser("status", help="查看守护进程状态")
+    subparsers.add_parser("shutdown", help="停止守护进程")
+
+    args = parser.parse_args()
+
+    request = {'type': args.command}
+    if args.command in ("publish", "comment", "verify"):
+        request['account'] = args.account
+    if args.command == "publish":
+        request['draft'] = args.draft
+    elif args.command == "comment":
+        request['note_url'] = args.note_url
+
+    try:
+        response = send_request(request, args.socket, args.port)
+    except OSError as e:
+        print(f"❌ 无法连接守护进程: {e}")
+        print("请先运行: python main.py --mode daemon")
+        sys.exit(1)
+
+    if not response.get('ok'):
+        print(f"❌ {response.get('error')}")
+        sys.exit(1)
+
+    print(json.dumps(response['result'], ensure_ascii=False, indent=2))
+    result = response['result']
+    if isinstance(result, dict) and result.get('status') == 'failed':
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()